@@ -1,44 +1,121 @@
 import os
 import math
 import time
+import sys
+import mmap
+from contextlib import nullcontext
 import zstandard as zstd
 from pathlib import Path
-from qiskit import QuantumCircuit
+
+# Zstd contexts shared by every call instead of being rebuilt each time
+_CCTX_FINAL = zstd.ZstdCompressor(level=19, threads=-1, write_content_size=True)
+_DCTX = zstd.ZstdDecompressor()
+
+# Files larger than this are (de)compressed as streams to bound memory use
+STREAM_THRESHOLD = 64 * 1024 * 1024
+STREAM_BLOCK_SIZE = 4 * 1024 * 1024
+
+# OS-level buffer for file I/O, independent of the logical reversal chunk size
+IO_BUFFER_SIZE = 1024 * 1024
+
+# Function to reverse every chunk of buf[:end] in place (the short tail included)
+def reverse_chunks_in_place(buf, chunk_size, end=None):
+    end = len(buf) if end is None else end
+    full = end - end % chunk_size
+    if chunk_size // 2 <= full // chunk_size:
+        # Fewer lane pairs than chunks: swap mirrored byte lanes with strided copies
+        for k in range(chunk_size // 2):
+            mirror = chunk_size - 1 - k
+            buf[k:full:chunk_size], buf[mirror:full:chunk_size] = buf[mirror:full:chunk_size], buf[k:full:chunk_size]
+    else:
+        for lo in range(0, full, chunk_size):
+            buf[lo:lo + chunk_size] = buf[lo:lo + chunk_size][::-1]
+    buf[full:end] = buf[full:end][::-1]
+
+# Function to reverse every chunk of data in memory (the short tail included)
+def reverse_chunks(data, chunk_size):
+    buf = bytearray(data)
+    reverse_chunks_in_place(buf, chunk_size)
+    return buf
 
 # Function to reverse chunks of data and save
 def reverse_and_save(input_filename, reversed_filename, chunk_size):
     try:
-        with open(input_filename, 'rb') as infile, open(reversed_filename, 'wb') as outfile:
-            while chunk := infile.read(chunk_size):
-                outfile.write(chunk[::-1])  # Reverse the chunk before writing
+        # Read whole chunks per block so the read size does not shrink with the chunk size
+        block_size = max(1, IO_BUFFER_SIZE // chunk_size) * chunk_size
+        with open(input_filename, 'rb', buffering=IO_BUFFER_SIZE) as infile, \
+                open(reversed_filename, 'wb', buffering=IO_BUFFER_SIZE) as outfile:
+            while block := infile.read(block_size):
+                outfile.write(reverse_chunks(block, chunk_size))  # Reverse each chunk before writing
         return os.path.getsize(reversed_filename)
     except Exception as e:
         print(f"❌ Error: {e}")
         return None
 
+# Function to map an input file read-only (empty files cannot be mapped)
+def map_input(infile, file_size):
+    return mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) if file_size else nullcontext(b"")
+
+# Function to reverse a buffer in chunks and compress it straight into a file
+def compress_buffer(data, compressed_filename, chunk_size):
+    # Blocks hold whole chunks so each one reverses independently
+    block_size = max(1, STREAM_BLOCK_SIZE // chunk_size) * chunk_size
+    view = memoryview(data)
+    try:
+        with open(compressed_filename, 'wb', buffering=IO_BUFFER_SIZE) as outfile, \
+                _CCTX_FINAL.stream_writer(outfile, size=len(view)) as writer:
+            for lo in range(0, len(view), block_size):
+                writer.write(reverse_chunks(view[lo:lo + block_size], chunk_size))
+        return os.path.getsize(compressed_filename)
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return None
+    finally:
+        view.release()  # The buffer may be an mmap that is closed right after
+
 # Function to compress the reversed file using zstd
 def compress_reversed(reversed_filename, compressed_filename):
     try:
-        with open(reversed_filename, 'rb') as infile:
-            compressed_data = zstd.compress(infile.read())  # Compress entire reversed file
-            with open(compressed_filename, 'wb') as outfile:
-                outfile.write(compressed_data)
+        with open(reversed_filename, 'rb') as infile, open(compressed_filename, 'wb') as outfile:
+            reversed_size = os.path.getsize(reversed_filename)
+            if reversed_size > STREAM_THRESHOLD:
+                _CCTX_FINAL.copy_stream(infile, outfile, size=reversed_size)  # Stream large files through the compressor
+            else:
+                outfile.write(_CCTX_FINAL.compress(infile.read()))  # Compress entire reversed file
         return os.path.getsize(compressed_filename)
     except Exception as e:
         print(f"❌ Error: {e}")
         return None
 
+# Function to decompress a whole frame into an output buffer sized from the frame header
+def decompress_frame(compressed_data):
+    content_size = zstd.frame_content_size(compressed_data)
+    if content_size < 0:
+        return _DCTX.decompressobj().decompress(compressed_data)  # Size not recorded in the frame
+    return _DCTX.decompress(compressed_data, max_output_size=content_size)
+
 # Function to decompress and restore the original file
 def decompress_and_restore(compressed_filename, restored_filename, chunk_size):
     try:
+        if os.path.getsize(compressed_filename) > STREAM_THRESHOLD:
+            # Decompress block by block; blocks hold whole chunks so they reverse independently
+            block_size = max(1, STREAM_BLOCK_SIZE // chunk_size) * chunk_size
+            with open(compressed_filename, 'rb') as infile, _DCTX.stream_reader(infile) as reader, \
+                    open(restored_filename, 'wb') as outfile:
+                block = bytearray(block_size)  # Reused for every block
+                view = memoryview(block)
+                while size := reader.readinto(block):
+                    reverse_chunks_in_place(block, chunk_size, size)
+                    outfile.write(view[:size])
+            return os.path.getsize(restored_filename)
+
         with open(compressed_filename, 'rb') as infile:
             compressed_data = infile.read()
 
-        decompressed_data = zstd.decompress(compressed_data)  # Decompress the data
+        decompressed_data = decompress_frame(compressed_data)  # Decompress the data
 
         # Reverse again in chunks to restore the original order
-        restored_data = b"".join([decompressed_data[i:i+chunk_size][::-1] 
-                                  for i in range(0, len(decompressed_data), chunk_size)])
+        restored_data = reverse_chunks(decompressed_data, chunk_size)
         
         with open(restored_filename, 'wb') as outfile:
             outfile.write(restored_data)
@@ -48,13 +125,16 @@ def decompress_and_restore(compressed_filename, restored_filename, chunk_size):
         print(f"❌ Error: {e}")
         return None
 
-# Function to simulate a quantum circuit with X+1 qubits
-def quantum_compress(file_size):
+# Function to simulate a quantum circuit with X+1 qubits (built only with --with-circuit)
+def quantum_compress(file_size, with_circuit=False):
     X = math.floor(math.log2(file_size)) if file_size > 0 else 1
     num_qubits = X + 1  # X+1 rule
 
     print(f"🔬 Quantum Simulation: Using {num_qubits} qubits (X = {X}, X+1 rule applied)")
-    
+    if not with_circuit:
+        return
+
+    from qiskit import QuantumCircuit  # Imported lazily: qiskit is slow to load
     qc = QuantumCircuit(num_qubits)
     qc.h(range(num_qubits))  # Apply Hadamard gate to each qubit
     for qubit in range(num_qubits - 1):  
@@ -64,19 +144,19 @@ def quantum_compress(file_size):
 
 # Main function to process compression
 def check_extract_save_num_check_and_chunk(input_filename):
-    file_size = os.path.getsize(input_filename)
+    file_size = os.stat(input_filename).st_size
+    chunk_size = max(file_size, 1)
 
     # File paths
-    reversed_file = input_filename + ".rev"
     compressed_file = f"{input_filename}.b"
     restored_file = f"extract.{Path(input_filename).name}"
 
     # Start compression timer
     start_compress = time.perf_counter_ns()
 
-    # Process compression
-    reverse_and_save(input_filename, reversed_file, file_size)
-    compress_reversed(reversed_file, compressed_file)
+    # Process compression straight from the mapped input, without a reversed temp file
+    with open(input_filename, 'rb') as infile, map_input(infile, file_size) as data:
+        compress_buffer(data, compressed_file, chunk_size)
 
     # End compression timer
     end_compress = time.perf_counter_ns()
@@ -86,7 +166,7 @@ def check_extract_save_num_check_and_chunk(input_filename):
     # Start extraction timer
     start_extract = time.perf_counter_ns()
 
-    decompress_and_restore(compressed_file, restored_file, file_size)
+    restored_size = decompress_and_restore(compressed_file, restored_file, chunk_size)
 
     # End extraction timer
     end_extract = time.perf_counter_ns()
@@ -94,33 +174,27 @@ def check_extract_save_num_check_and_chunk(input_filename):
     print(f"⏳ Extraction time: {extraction_time_ns} nanoseconds")
 
     # Check file integrity
-    original_size = os.path.getsize(input_filename)
-    restored_size = os.path.getsize(restored_file)
-
-    print(f"Original file size: {original_size} bytes.")
+    print(f"Original file size: {file_size} bytes.")
     print(f"Restored file size: {restored_size} bytes.")
 
-    if original_size == restored_size:
+    if file_size == restored_size:
         print("✅ File successfully restored with correct size.")
     else:
         print("❌ Warning: Restored file size does not match the original.")
 
-    # Cleanup temporary files
-    os.remove(reversed_file) if os.path.exists(reversed_file) else None
-    print(f"✅ Removed temporary file '{reversed_file}'.")
-
     print(f"✅ Three files are left:\n  1️⃣ Original: '{input_filename}'\n  2️⃣ Compressed: '{compressed_file}'\n  3️⃣ Restored: '{restored_file}'")
 
 # Main interactive function
 def main():
     print("Created by Jurijus Pacalovas.")
+    with_circuit = "--with-circuit" in sys.argv
     
     mode = input("Enter mode (compress/extract): ").strip().lower()
     input_file = input("Enter input file name: ").strip()
 
     if mode == "compress":
         check_extract_save_num_check_and_chunk(input_file)
-        quantum_compress(os.path.getsize(input_file))
+        quantum_compress(os.path.getsize(input_file), with_circuit)
 
     elif mode == "extract":
         restored_file = f"extract.{Path(input_file).stem}"
@@ -135,7 +209,7 @@ def main():
         extraction_time_ns = end_extract - start_extract
         print(f"⏳ Extraction time: {extraction_time_ns} nanoseconds")
 
-        quantum_compress(os.path.getsize(restored_file))
+        quantum_compress(os.path.getsize(restored_file), with_circuit)
 
     else:
         print("❌ Invalid mode selected.")
@@ -1,78 +1,213 @@
 import os
 import time
+import sys
+import mmap
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 import zstandard as zstd
 from pathlib import Path
 import math
-from qiskit import QuantumCircuit
+
+# Zstd contexts shared by every call instead of being rebuilt each time.
+# Search trials only rank candidates, so they use a cheap level; the final output uses a high one.
+# Trials run on several threads and a ZstdCompressor is not thread-safe, so each thread keeps its own.
+_TRIAL_LOCAL = threading.local()
+_CCTX_FINAL = zstd.ZstdCompressor(level=19, threads=-1, write_content_size=True)
+_DCTX = zstd.ZstdDecompressor()
+
+# Files larger than this are (de)compressed as streams to bound memory use
+STREAM_THRESHOLD = 64 * 1024 * 1024
+STREAM_BLOCK_SIZE = 4 * 1024 * 1024
+
+# OS-level buffer for file I/O, independent of the logical reversal chunk size
+IO_BUFFER_SIZE = 1024 * 1024
+
+# Threads running search trials in parallel (zstd releases the GIL while compressing)
+SEARCH_WORKERS = os.cpu_count() or 1
+
+# Number of midpoint probes around the best power-of-two chunk size
+REFINE_STEPS = 4
+
+# Stop the power-of-two sweep after this many trials in a row without improvement
+PATIENCE = 16
+
+# Function to reverse every chunk of buf[:end] in place (the short tail included)
+def reverse_chunks_in_place(buf, chunk_size, end=None):
+    end = len(buf) if end is None else end
+    full = end - end % chunk_size
+    if chunk_size // 2 <= full // chunk_size:
+        # Fewer lane pairs than chunks: swap mirrored byte lanes with strided copies
+        for k in range(chunk_size // 2):
+            mirror = chunk_size - 1 - k
+            buf[k:full:chunk_size], buf[mirror:full:chunk_size] = buf[mirror:full:chunk_size], buf[k:full:chunk_size]
+    else:
+        for lo in range(0, full, chunk_size):
+            buf[lo:lo + chunk_size] = buf[lo:lo + chunk_size][::-1]
+    buf[full:end] = buf[full:end][::-1]
+
+# Function to reverse every chunk of data in memory (the short tail included)
+def reverse_chunks(data, chunk_size):
+    buf = bytearray(data)
+    reverse_chunks_in_place(buf, chunk_size)
+    return buf
 
 # Function to reverse data in chunks
 def reverse_and_save(input_filename, reversed_filename, chunk_size):
-    with open(input_filename, 'rb') as infile, open(reversed_filename, 'wb') as outfile:
-        while chunk := infile.read(chunk_size):
-            outfile.write(chunk[::-1])  # Reverse each chunk before writing
+    # Read whole chunks per block so the read size does not shrink with the chunk size
+    block_size = max(1, IO_BUFFER_SIZE // chunk_size) * chunk_size
+    with open(input_filename, 'rb', buffering=IO_BUFFER_SIZE) as infile, \
+            open(reversed_filename, 'wb', buffering=IO_BUFFER_SIZE) as outfile:
+        while block := infile.read(block_size):
+            outfile.write(reverse_chunks(block, chunk_size))  # Reverse each chunk before writing
+
+# Function to map an input file read-only (empty files cannot be mapped)
+def map_input(infile, file_size):
+    return mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) if file_size else nullcontext(b"")
+
+# Function to reverse a buffer in chunks and compress it straight into a file, chunk size embedded
+def compress_buffer(data, compressed_filename, chunk_size):
+    chunk_size_bytes = chunk_size.to_bytes(4, 'big')
+    # Blocks hold whole chunks so each one reverses independently
+    block_size = max(1, STREAM_BLOCK_SIZE // chunk_size) * chunk_size
+    view = memoryview(data)
+    try:
+        with open(compressed_filename, 'wb', buffering=IO_BUFFER_SIZE) as outfile, \
+                _CCTX_FINAL.stream_writer(outfile, size=len(chunk_size_bytes) + len(view)) as writer:
+            writer.write(chunk_size_bytes)
+            for lo in range(0, len(view), block_size):
+                writer.write(reverse_chunks(view[lo:lo + block_size], chunk_size))
+    finally:
+        view.release()  # The buffer may be an mmap that is closed right after
+
+# Function to compress reversed data in memory with the chunk size embedded
+def compress_reversed_bytes(reversed_data, chunk_size, cctx=_CCTX_FINAL):
+    return cctx.compress(chunk_size.to_bytes(4, 'big') + reversed_data)
 
 # Function to compress and embed chunk size
 def compress_reversed(reversed_filename, compressed_filename, chunk_size):
-    with open(reversed_filename, 'rb') as infile:
-        reversed_data = infile.read()
-    
     # Embed the chunk size at the beginning (4 bytes, big-endian)
     chunk_size_bytes = chunk_size.to_bytes(4, 'big')
-    compressed_data = zstd.compress(chunk_size_bytes + reversed_data)
+
+    reversed_size = os.path.getsize(reversed_filename)
+    if reversed_size > STREAM_THRESHOLD:
+        with open(reversed_filename, 'rb') as infile, open(compressed_filename, 'wb') as outfile, \
+                _CCTX_FINAL.stream_writer(outfile, size=len(chunk_size_bytes) + reversed_size) as writer:
+            writer.write(chunk_size_bytes)
+            while block := infile.read(STREAM_BLOCK_SIZE):
+                writer.write(block)
+        return
+
+    with open(reversed_filename, 'rb') as infile:
+        reversed_data = infile.read()
+
+    compressed_data = compress_reversed_bytes(reversed_data, chunk_size)
 
     with open(compressed_filename, 'wb') as outfile:
         outfile.write(compressed_data)
 
+# Function to decompress a whole frame into an output buffer sized from the frame header
+def decompress_frame(compressed_data):
+    content_size = zstd.frame_content_size(compressed_data)
+    if content_size < 0:
+        return _DCTX.decompressobj().decompress(compressed_data)  # Size not recorded in the frame
+    return _DCTX.decompress(compressed_data, max_output_size=content_size)
+
 # Function to decompress and restore the original file
 def decompress_and_restore(compressed_filename, restored_filename):
+    if os.path.getsize(compressed_filename) > STREAM_THRESHOLD:
+        with open(compressed_filename, 'rb') as infile, _DCTX.stream_reader(infile) as reader, \
+                open(restored_filename, 'wb') as outfile:
+            chunk_size = int.from_bytes(reader.read(4), 'big')
+            # Blocks hold whole chunks so each one reverses independently
+            block_size = max(1, STREAM_BLOCK_SIZE // chunk_size) * chunk_size
+            block = bytearray(block_size)  # Reused for every block
+            view = memoryview(block)
+            while size := reader.readinto(block):
+                reverse_chunks_in_place(block, chunk_size, size)
+                outfile.write(view[:size])
+        return
+
     with open(compressed_filename, 'rb') as infile:
         compressed_data = infile.read()
 
-    decompressed_data = zstd.decompress(compressed_data)
+    decompressed_data = decompress_frame(compressed_data)
     
     # Extract the first 4 bytes to get the chunk size
     chunk_size = int.from_bytes(decompressed_data[:4], 'big')
-    reversed_data = decompressed_data[4:]  # The actual reversed data
+    reversed_data = memoryview(decompressed_data)[4:]  # The actual reversed data (no copy)
     
     # Reverse chunks again to restore original order
-    restored_data = b"".join(
-        [reversed_data[i:i+chunk_size][::-1] for i in range(0, len(reversed_data), chunk_size)]
-    )
+    restored_data = reverse_chunks(reversed_data, chunk_size)
 
     with open(restored_filename, 'wb') as outfile:
         outfile.write(restored_data)
 
-# Function to determine the best chunk size
-def find_best_chunk_size(input_filename):
-    file_size = os.path.getsize(input_filename)
-    best_chunk_size = 1
-    best_compression_ratio = float('inf')
-
-    print(f"📏 Checking best chunk size from 1 to {file_size} bytes...")
+# Function to get the calling thread's fast compressor for search trials
+def trial_compressor():
+    if not hasattr(_TRIAL_LOCAL, 'cctx'):
+        _TRIAL_LOCAL.cctx = zstd.ZstdCompressor(level=1)
+    return _TRIAL_LOCAL.cctx
 
-    for chunk_size in range(1, file_size + 1):
-        reversed_file = input_filename + ".rev"
-        compressed_file = f"compress.{Path(input_filename).name}.b"
-        
-        reverse_and_save(input_filename, reversed_file, chunk_size)
-        compress_reversed(reversed_file, compressed_file, chunk_size)
+# Function to measure the compressed size of one chunk size, fully in memory
+def compressed_size_for(data, chunk_size):
+    return len(compress_reversed_bytes(reverse_chunks(data, chunk_size), chunk_size, trial_compressor()))
 
-        compressed_size = os.path.getsize(compressed_file)
-        compression_ratio = compressed_size / file_size
-
-        if compression_ratio < best_compression_ratio:
-            best_compression_ratio = compression_ratio
-            best_chunk_size = chunk_size
-
-        os.remove(reversed_file)
-        os.remove(compressed_file)
+# Function to determine the best chunk size
+def find_best_chunk_size(input_filename, data=None):
+    if data is None:
+        data = Path(input_filename).read_bytes()  # Read the input once for every trial
 
-    print(f"✅ Best chunk size: {best_chunk_size} bytes (Compression Ratio: {best_compression_ratio:.4f})")
+    file_size = len(data)
+    best_chunk_size = 1
+    best_compression_ratio = float('inf')
+    tried = {}
+
+    def probe_batch(executor, chunk_sizes):
+        nonlocal best_chunk_size, best_compression_ratio
+        fresh = [cs for cs in dict.fromkeys(chunk_sizes) if 1 <= cs <= file_size and cs not in tried]
+        sizes = executor.map(lambda cs: compressed_size_for(data, cs), fresh)
+
+        # Record results in submission order so ties resolve as in a serial scan
+        improved = []
+        for chunk_size, compressed_size in zip(fresh, sizes):
+            tried[chunk_size] = compressed_size / file_size
+            improved.append(tried[chunk_size] < best_compression_ratio)
+            if improved[-1]:
+                best_compression_ratio = tried[chunk_size]
+                best_chunk_size = chunk_size
+        return improved
+
+    print(f"📏 Checking best chunk size from 1 to {file_size} bytes (powers of two)...")
+
+    with ThreadPoolExecutor(max_workers=SEARCH_WORKERS) as executor:
+        # Logarithmic sweep: 1, 2, 4, ..., file_size, one batch of trials per round
+        sweep = [min(1 << k, file_size) for k in range(file_size.bit_length() + 1)]
+        since_improve = 0
+        for start in range(0, len(sweep), SEARCH_WORKERS):
+            for improved in probe_batch(executor, sweep[start:start + SEARCH_WORKERS]):
+                since_improve = 0 if improved else since_improve + 1
+            if since_improve > PATIENCE:
+                break
+
+        # Refine with midpoints between the best power of two and its neighbours
+        low, high = max(1, best_chunk_size // 2), min(file_size, best_chunk_size * 2)
+        for _ in range(REFINE_STEPS):
+            center = best_chunk_size
+            probe_batch(executor, [(low + center) // 2, (center + high) // 2])
+            low, high = (low + best_chunk_size) // 2, (best_chunk_size + high) // 2
+
+    print(f"✅ Best chunk size: {best_chunk_size} bytes (Compression Ratio: {best_compression_ratio:.4f}, {len(tried)} trials)")
     return best_chunk_size
 
-# Quantum circuit simulation
-def quantum_compression_simulation(file_size):
+# Quantum circuit simulation (the circuit is built only with --with-circuit)
+def quantum_compression_simulation(file_size, with_circuit=False):
     num_qubits = math.ceil(math.log2(file_size)) + 1  # X+1 qubits
+    if not with_circuit:
+        print(f"⚛️ Quantum simulation would use {num_qubits} qubits.")
+        return
+
+    from qiskit import QuantumCircuit  # Imported lazily: qiskit is slow to load
     qc = QuantumCircuit(num_qubits)
 
     qc.h(range(num_qubits))  # Superposition
@@ -82,19 +217,19 @@ def quantum_compression_simulation(file_size):
     print(f"⚛️ Quantum Circuit Created with {num_qubits} qubits (for simulation).")
 
 # Compression process
-def process_compression(input_filename):
-    file_size = os.path.getsize(input_filename)
-    best_chunk_size = find_best_chunk_size(input_filename)
-
-    reversed_file = input_filename + ".rev"
+def process_compression(input_filename, with_circuit=False):
+    file_size = os.stat(input_filename).st_size
     compressed_file = f"compress.{Path(input_filename).name}.b"
     restored_file = f"extract.{Path(input_filename).name}"
 
-    # Start compression timer
-    start_compress = time.perf_counter_ns()
+    # Map the input once; the search and the final compression both read from the mapping
+    with open(input_filename, 'rb') as infile, map_input(infile, file_size) as data:
+        best_chunk_size = find_best_chunk_size(input_filename, data)
+
+        # Start compression timer
+        start_compress = time.perf_counter_ns()
 
-    reverse_and_save(input_filename, reversed_file, best_chunk_size)
-    compress_reversed(reversed_file, compressed_file, best_chunk_size)
+        compress_buffer(data, compressed_file, best_chunk_size)
 
     # End compression timer
     end_compress = time.perf_counter_ns()
@@ -111,12 +246,10 @@ def process_compression(input_filename):
     extraction_time_ns = end_extract - start_extract
     print(f"⏳ Extraction time: {extraction_time_ns} nanoseconds")
 
-    quantum_compression_simulation(file_size)
+    quantum_compression_simulation(file_size, with_circuit)
 
     print(f"✅ Three files remain:\n  1️⃣ Original: '{input_filename}'\n  2️⃣ Best Compressed: '{compressed_file}'\n  3️⃣ Restored: '{restored_file}'")
 
-    os.remove(reversed_file)  # Cleanup temporary file
-
 # Extraction process
 def process_extraction(input_filename):
     restored_file = f"extract.{Path(input_filename).name.replace('compress.', '').replace('.b', '')}"
@@ -141,7 +274,7 @@ def main():
     input_file = input("Enter input file name: ").strip()
 
     if mode == "compress":
-        process_compression(input_file)
+        process_compression(input_file, "--with-circuit" in sys.argv)
     elif mode == "extract":
         process_extraction(input_file)
     else:
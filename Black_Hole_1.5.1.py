@@ -1,13 +1,27 @@
 import os
 import time
+import sys
 import zstandard as zstd  # Importing Zstd for compression
 from pathlib import Path
 import struct
-from qiskit import QuantumCircuit
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Zstd contexts shared by every call instead of being rebuilt each time.
+# Search trials only rank candidates, so they use a cheap level; the final output uses a high one.
+# Trials run on several threads and a ZstdCompressor is not thread-safe, so each thread keeps its own.
+_TRIAL_LOCAL = threading.local()
+_CCTX_FINAL = zstd.ZstdCompressor(level=19, threads=-1, write_content_size=True)
+_DCTX = zstd.ZstdDecompressor()
+
+# OS-level buffer for file I/O, independent of the logical reversal chunk size
+IO_BUFFER_SIZE = 1024 * 1024
 
 # Function to run a quantum computation (without Aer, transpile, or execute)
 def quantum_computation_example():
     print("\n🔮 Running a basic quantum computation without Aer, transpile, or execute:")
+    from qiskit import QuantumCircuit  # Imported lazily: qiskit is slow to load
 
     # Create a quantum circuit with 2 qubits and 2 classical bits
     circuit = QuantumCircuit(2, 2)
@@ -25,104 +39,182 @@ def quantum_computation_example():
     print("\nQuantum Circuit:")
     print(circuit)
 
+# Function to reverse every chunk of buf[:end] in place (the short tail included)
+def reverse_chunks_in_place(buf, chunk_size, end=None):
+    end = len(buf) if end is None else end
+    full = end - end % chunk_size
+    if chunk_size // 2 <= full // chunk_size:
+        # Fewer lane pairs than chunks: swap mirrored byte lanes with strided copies
+        for k in range(chunk_size // 2):
+            mirror = chunk_size - 1 - k
+            buf[k:full:chunk_size], buf[mirror:full:chunk_size] = buf[mirror:full:chunk_size], buf[k:full:chunk_size]
+    else:
+        for lo in range(0, full, chunk_size):
+            buf[lo:lo + chunk_size] = buf[lo:lo + chunk_size][::-1]
+    buf[full:end] = buf[full:end][::-1]
+
+# Function to reverse every chunk of data in memory (the short tail included)
+def reverse_chunks(data, chunk_size):
+    buf = bytearray(data)
+    reverse_chunks_in_place(buf, chunk_size)
+    return buf
+
+# Function to reverse the first `num_chunks` chunks of data in memory
+def reverse_first_chunks(data, chunk_size, num_chunks):
+    if chunk_size == 1 or num_chunks == 0:
+        return data  # Nothing to reverse: the output is the input
+    buf = bytearray(data)
+    reverse_chunks_in_place(buf, chunk_size, min(len(buf), chunk_size * num_chunks))
+    return buf
+
 # Function to reverse data in chunks based on chunk count
 def reverse_and_save(input_filename, reversed_filename, chunk_size, num_chunks):
-    with open(input_filename, 'rb') as infile, open(reversed_filename, 'wb') as outfile:
+    if num_chunks == 0:
+        shutil.copyfile(input_filename, reversed_filename)  # Nothing to reverse: kernel-side copy
+        return
+
+    with open(input_filename, 'rb', buffering=IO_BUFFER_SIZE) as infile, \
+            open(reversed_filename, 'wb', buffering=IO_BUFFER_SIZE) as outfile:
         data = infile.read()
-        chunked_data = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
-        
-        # Reverse the first `num_chunks` chunks
-        for i in range(num_chunks):
-            if i < len(chunked_data):
-                chunked_data[i] = chunked_data[i][::-1]
-        
-        outfile.write(b"".join(chunked_data))
+        outfile.write(reverse_first_chunks(data, chunk_size, num_chunks))
+
+# Function to compress reversed data in memory with its metadata (num_chunks)
+def compress_reversed_bytes(reversed_data, num_chunks, cctx=_CCTX_FINAL):
+    # Store metadata (num_chunks) in the first 2 bytes
+    metadata = struct.pack(">H", num_chunks)  # Store num_chunks as a 10-bit value in 2 bytes
+
+    # Compress data using Zstd
+    return cctx.compress(metadata + reversed_data)
 
 # Function to compress and save metadata (chunk size + num_chunks) with Zstd
 def compress_reversed_with_zstd(reversed_filename, compressed_filename, chunk_size, num_chunks):
     with open(reversed_filename, 'rb') as infile:
         reversed_data = infile.read()
 
-    # Store metadata (num_chunks) in the first 2 bytes
-    metadata = struct.pack(">H", num_chunks)  # Store num_chunks as a 10-bit value in 2 bytes
-
-    # Compress data using Zstd
-    cctx = zstd.ZstdCompressor()
-    compressed_data = cctx.compress(metadata + reversed_data)
+    compressed_data = compress_reversed_bytes(reversed_data, num_chunks)
 
     with open(compressed_filename, 'wb') as outfile:
         outfile.write(compressed_data)
 
+# Function to decompress a whole frame into an output buffer sized from the frame header
+def decompress_frame(compressed_data):
+    content_size = zstd.frame_content_size(compressed_data)
+    if content_size < 0:
+        return _DCTX.decompressobj().decompress(compressed_data)  # Size not recorded in the frame
+    return _DCTX.decompress(compressed_data, max_output_size=content_size)
+
 # Function to decompress and restore the original file with Zstd
 def decompress_and_restore_with_zstd(compressed_filename, restored_filename):
     with open(compressed_filename, 'rb') as infile:
         compressed_data = infile.read()
 
     # Decompress the data using Zstd
-    dctx = zstd.ZstdDecompressor()
-    decompressed_data = dctx.decompress(compressed_data)
+    decompressed_data = decompress_frame(compressed_data)
 
     # Read metadata (first 2 bytes for num_chunks)
     num_chunks = struct.unpack(">H", decompressed_data[:2])[0] & 0x03FF  # Mask 10 bits
-    reversed_data = decompressed_data[2:]  # Actual reversed data
+    reversed_data = memoryview(decompressed_data)[2:]  # Actual reversed data (no copy)
 
     # Reconstruct the original file by reversing the first `num_chunks` chunks
     chunk_size = len(reversed_data) // num_chunks  # Approximate chunk size
-    chunked_data = [reversed_data[i:i + chunk_size] for i in range(0, len(reversed_data), chunk_size)]
-    for i in range(num_chunks):
-        if i < len(chunked_data):
-            chunked_data[i] = chunked_data[i][::-1]
-
-    restored_data = b"".join(chunked_data)
+    restored_data = reverse_first_chunks(reversed_data, chunk_size, num_chunks)
 
     with open(restored_filename, 'wb') as outfile:
         outfile.write(restored_data)
 
+# Threads running search trials in parallel (zstd releases the GIL while compressing)
+SEARCH_WORKERS = os.cpu_count() or 1
+
+# Move on to the next chunk size after this many reversed-chunk counts in a row fail to improve
+NUM_CHUNKS_PATIENCE = 3
+
+# Function to list powers of two from 1 up to and including `limit`
+def powers_of_two(limit):
+    return sorted({min(1 << k, limit) for k in range(limit.bit_length() + 1)}) if limit > 0 else []
+
+# Function to get the calling thread's fast compressor for search trials
+def trial_compressor():
+    if not hasattr(_TRIAL_LOCAL, 'cctx'):
+        _TRIAL_LOCAL.cctx = zstd.ZstdCompressor(level=1)
+    return _TRIAL_LOCAL.cctx
+
+# Function to measure the compressed size of one parameter pair, fully in memory
+def compressed_size_for(data, chunk_size, num_chunks):
+    return len(compress_reversed_bytes(reverse_first_chunks(data, chunk_size, num_chunks), num_chunks, trial_compressor()))
+
+# Function to sweep the reversed-chunk counts of one chunk size until they stop improving
+def sweep_num_chunks(data, chunk_size):
+    results = []
+    best_ratio = float('inf')
+    since_improve = 0
+    for num_chunks in powers_of_two(len(data) // chunk_size):
+        compression_ratio = compressed_size_for(data, chunk_size, num_chunks) / len(data)
+        results.append(((chunk_size, num_chunks), compression_ratio))
+        since_improve = 0 if compression_ratio < best_ratio else since_improve + 1
+        best_ratio = min(best_ratio, compression_ratio)
+        if since_improve >= NUM_CHUNKS_PATIENCE:
+            break
+    return results
+
 # Function to determine the best chunk size and number of reversed chunks
-def find_best_parameters(input_filename):
-    file_size = os.path.getsize(input_filename)
+def find_best_parameters(input_filename, data=None):
+    if data is None:
+        data = Path(input_filename).read_bytes()  # Read the input once for every trial
+
+    file_size = len(data)
     best_chunk_size = 1
     best_num_chunks = 1
     best_compression_ratio = float('inf')
+    tried = {}
 
-    print(f"📏 Finding the best parameters (chunk size and reversed chunks)...")
-
-    for chunk_size in range(1, file_size + 1):
-        for num_chunks in range(1, file_size // chunk_size + 1):
-            reversed_file = input_filename + ".rev"
-            compressed_file = f"compress.{Path(input_filename).name}.b"
-
-            reverse_and_save(input_filename, reversed_file, chunk_size, num_chunks)
-            compress_reversed_with_zstd(reversed_file, compressed_file, chunk_size, num_chunks)
-
-            compressed_size = os.path.getsize(compressed_file)
-            compression_ratio = compressed_size / file_size
+    def record(chunk_size, num_chunks, compression_ratio):
+        nonlocal best_chunk_size, best_num_chunks, best_compression_ratio
+        tried[(chunk_size, num_chunks)] = compression_ratio
+        if compression_ratio < best_compression_ratio:
+            best_compression_ratio = compression_ratio
+            best_chunk_size = chunk_size
+            best_num_chunks = num_chunks
 
-            if compression_ratio < best_compression_ratio:
-                best_compression_ratio = compression_ratio
-                best_chunk_size = chunk_size
-                best_num_chunks = num_chunks
-
-            os.remove(reversed_file)
-            os.remove(compressed_file)
+    print(f"📏 Finding the best parameters (chunk size and reversed chunks)...")
 
-    print(f"✅ Best chunk size: {best_chunk_size}, best reversed chunks: {best_num_chunks} (Compression Ratio: {best_compression_ratio:.4f})")
+    with ThreadPoolExecutor(max_workers=SEARCH_WORKERS) as executor:
+        # Log-spaced grid: powers of two for both axes, one chunk size per thread.
+        # Results are recorded in grid order so ties resolve as in a serial scan.
+        for results in executor.map(lambda cs: sweep_num_chunks(data, cs), powers_of_two(file_size)):
+            for (chunk_size, num_chunks), compression_ratio in results:
+                record(chunk_size, num_chunks, compression_ratio)
+
+        # Local refinement halfway towards the neighbouring powers of two
+        grid_chunk_size, grid_num_chunks = best_chunk_size, best_num_chunks
+        candidates = [
+            (chunk_size, num_chunks)
+            for chunk_size in (grid_chunk_size * 3 // 4, grid_chunk_size, grid_chunk_size * 3 // 2)
+            for num_chunks in (grid_num_chunks * 3 // 4, grid_num_chunks, grid_num_chunks * 3 // 2)
+            if 1 <= chunk_size <= file_size and 1 <= num_chunks <= file_size // chunk_size
+            and (chunk_size, num_chunks) not in tried
+        ]
+        candidates = list(dict.fromkeys(candidates))
+        sizes = executor.map(lambda key: compressed_size_for(data, *key), candidates)
+        for (chunk_size, num_chunks), compressed_size in zip(candidates, sizes):
+            record(chunk_size, num_chunks, compressed_size / file_size)
+
+    print(f"✅ Best chunk size: {best_chunk_size}, best reversed chunks: {best_num_chunks} (Compression Ratio: {best_compression_ratio:.4f}, {len(tried)} trials)")
     return best_chunk_size, best_num_chunks
 
 # Compression process with nanosecond timing
 def process_compression(input_filename):
-    file_size = os.path.getsize(input_filename)
-    best_chunk_size, best_num_chunks = find_best_parameters(input_filename)
+    data = Path(input_filename).read_bytes()  # The only read of the input
+    best_chunk_size, best_num_chunks = find_best_parameters(input_filename, data)
 
-    reversed_file = input_filename + ".rev"
     compressed_file = f"compress.{Path(input_filename).name}.b"
     restored_file = f"extract.{Path(input_filename).name}"
 
     # Start compression timer
     start_compress = time.perf_counter_ns()
 
-    reverse_and_save(input_filename, reversed_file, best_chunk_size, best_num_chunks)
-    compress_reversed_with_zstd(reversed_file, compressed_file, best_chunk_size, best_num_chunks)
+    reversed_data = reverse_first_chunks(data, best_chunk_size, best_num_chunks)
+    with open(compressed_file, 'wb') as outfile:
+        outfile.write(compress_reversed_bytes(reversed_data, best_num_chunks))
 
     # End compression timer
     end_compress = time.perf_counter_ns()
@@ -141,8 +233,6 @@ def process_compression(input_filename):
 
     print(f"✅ Three files remain:\n  1️⃣ Original: '{input_filename}'\n  2️⃣ Best Compressed: '{compressed_file}'\n  3️⃣ Restored: '{restored_file}'")
 
-    os.remove(reversed_file)  # Cleanup temporary file
-
 # Extraction process with nanosecond timing
 def process_extraction(input_filename):
     restored_file = f"extract.{Path(input_filename).name.replace('compress.', '').replace('.b', '')}"
@@ -163,8 +253,9 @@ def process_extraction(input_filename):
 def main():
     print("Created by Jurijus Pacalovas.")
     
-    # Always perform quantum computation (without Aer, transpile, or execute)
-    quantum_computation_example()
+    # Perform the quantum computation (without Aer, transpile, or execute) only on request
+    if "--with-circuit" in sys.argv:
+        quantum_computation_example()
 
     # User option for compress or extract
     mode = input("Enter mode (1 for compress, 2 for extract): ").strip()
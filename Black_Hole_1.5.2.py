@@ -2,87 +2,138 @@ import os
 import zstandard as zstd
 import random
 import struct
+import sys
+from array import array
 from pathlib import Path
-from qiskit import QuantumCircuit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Zstd contexts shared by every call instead of being rebuilt each time.
+# Search trials only rank candidates, so they use a cheap level; the final output uses a high one.
+# Trials run on several threads and a ZstdCompressor is not thread-safe, so each thread keeps its own.
+_TRIAL_LOCAL = threading.local()
+_CCTX_FINAL = zstd.ZstdCompressor(level=19, threads=-1, write_content_size=True)
+_DCTX = zstd.ZstdDecompressor()
+
+# Metadata header: original file size (8 bytes), chunk size (2 bytes), number of positions (2 bytes)
+_HDR = struct.Struct(">QHH")
+
+# Random source for the strategy search (seed it for reproducible runs)
+_RNG = random.Random()
+
+# Threads running search trials in parallel (zstd releases the GIL while compressing)
+SEARCH_WORKERS = os.cpu_count() or 1
+
+# Pack positions as big-endian 16-bit values in one conversion
+def pack_positions(positions):
+    packed = array('H', positions)
+    if sys.byteorder == 'little':
+        packed.byteswap()
+    return packed.tobytes()
+
+# Unpack `count` big-endian 16-bit positions starting at `offset`
+def unpack_positions(buf, offset, count):
+    positions = array('H')
+    positions.frombytes(memoryview(buf)[offset:offset + count * positions.itemsize])
+    if sys.byteorder == 'little':
+        positions.byteswap()
+    return positions
+
+# Reverse the chunks of a bytearray at the specified indices in place
+def reverse_positions_in_place(buf, chunk_size, positions):
+    if chunk_size == 1:
+        return  # One-byte chunks are their own reverse
+    total_chunks = len(buf) // chunk_size
+    for pos in positions:
+        if 0 <= pos < total_chunks:  # Ensure position is within bounds
+            lo = pos * chunk_size
+            buf[lo:lo + chunk_size] = buf[lo:lo + chunk_size][::-1]
+
+# Reverse chunks of in-memory data at specified indices starting from the first byte
+def reverse_positions(data, chunk_size, positions):
+    buf = bytearray(data)
+
+    # Pad a short last chunk only when it is reversed; restore trims back to the original size
+    tail = len(buf) % chunk_size
+    if tail and len(buf) // chunk_size in positions:
+        buf.extend(b'\x00' * (chunk_size - tail))
+
+    # Reverse chunks at the specified positions, starting from the first chunk
+    reverse_positions_in_place(buf, chunk_size, positions)
+    return buf
 
 # Reverse chunks at specified indices starting from the first byte
 def reverse_chunks_at_positions(input_filename, reversed_filename, chunk_size, positions):
     with open(input_filename, 'rb') as infile:
         data = infile.read()
 
-    # Ensure the chunking starts from byte 1
-    chunked_data = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
-
-    # Add padding to the last chunk if it's less than 64 bytes
-    if len(chunked_data[-1]) < chunk_size:
-        chunked_data[-1] = chunked_data[-1] + b'\x00' * (chunk_size - len(chunked_data[-1]))
+    with open(reversed_filename, 'wb') as outfile:
+        outfile.write(reverse_positions(data, chunk_size, positions))
 
-    # Reverse chunks at the specified positions, starting from the first chunk
-    for pos in positions:
-        if 0 <= pos < len(chunked_data):  # Ensure position is within bounds
-            chunked_data[pos] = chunked_data[pos][::-1]
+# Compress reversed data in memory with metadata
+def compress_bytes_with_zstd(reversed_data, chunk_size, positions, original_size, cctx=_CCTX_FINAL):
+    # Pack the chunk size, positions, and original file size into the metadata
+    metadata = _HDR.pack(original_size, chunk_size, len(positions))
+    metadata += pack_positions(positions)  # Store positions (2 bytes each)
 
-    with open(reversed_filename, 'wb') as outfile:
-        outfile.write(b"".join(chunked_data))
+    # Compress the data with the metadata
+    return cctx.compress(metadata + reversed_data)
 
 # Compress using Zstd with metadata
 def compress_with_zstd(reversed_filename, compressed_filename, chunk_size, positions, original_size):
     with open(reversed_filename, 'rb') as infile:
         reversed_data = infile.read()
 
-    # Pack the chunk size, positions, and original file size into the metadata
-    metadata = struct.pack(">Q", original_size)  # Store original file size (8 bytes)
-    metadata += struct.pack(">H", chunk_size)  # Store chunk size (2 bytes)
-    metadata += struct.pack(f">H", len(positions))  # Store number of positions (2 bytes)
-    metadata += struct.pack(f">{len(positions)}H", *positions)  # Store positions
-
-    # Compress the file with the metadata
-    cctx = zstd.ZstdCompressor()
-    compressed_data = cctx.compress(metadata + reversed_data)
+    compressed_data = compress_bytes_with_zstd(reversed_data, chunk_size, positions, original_size)
 
     with open(compressed_filename, 'wb') as outfile:
         outfile.write(compressed_data)
 
+# Function to decompress a whole frame into an output buffer sized from the frame header
+def decompress_frame(compressed_data):
+    content_size = zstd.frame_content_size(compressed_data)
+    if content_size < 0:
+        return _DCTX.decompressobj().decompress(compressed_data)  # Size not recorded in the frame
+    return _DCTX.decompress(compressed_data, max_output_size=content_size)
+
 # Decompression and restoration
 def decompress_and_restore(compressed_filename, restored_filename):
     with open(compressed_filename, 'rb') as infile:
         compressed_data = infile.read()
 
     # Decompress the data
-    dctx = zstd.ZstdDecompressor()
-    decompressed_data = dctx.decompress(compressed_data)
+    decompressed_data = decompress_frame(compressed_data)
 
     # Extract metadata
-    original_size = struct.unpack(">Q", decompressed_data[:8])[0]  # First 8 bytes for original file size
-    chunk_size = struct.unpack(">H", decompressed_data[8:10])[0]  # Next 2 bytes for chunk size
-    num_positions = struct.unpack(">H", decompressed_data[10:12])[0]  # Next 2 bytes for number of positions
-    positions = list(struct.unpack(f">{num_positions}H", decompressed_data[12:12 + num_positions * 2]))  # Extract positions
-
-    # Reconstruct the chunks
-    chunked_data = decompressed_data[12 + num_positions * 2:]
-
-    total_chunks = len(chunked_data) // chunk_size
-    chunked_data = [chunked_data[i * chunk_size:(i + 1) * chunk_size] for i in range(total_chunks)]
+    original_size, chunk_size, num_positions = _HDR.unpack_from(decompressed_data, 0)
+    positions = unpack_positions(decompressed_data, _HDR.size, num_positions)  # Extract positions
 
-    # Reverse the chunks at specified positions
-    for pos in positions:
-        if 0 <= pos < len(chunked_data):
-            chunked_data[pos] = chunked_data[pos][::-1]
-
-    restored_data = b"".join(chunked_data)
+    # Reverse the chunks at specified positions in a single buffer, copied once from the payload view
+    restored_data = bytearray(memoryview(decompressed_data)[_HDR.size + num_positions * 2:])
+    reverse_positions_in_place(restored_data, chunk_size, positions)
 
     # Trim to the original size
-    restored_data = restored_data[:original_size]
+    del restored_data[original_size:]
 
     with open(restored_filename, 'wb') as outfile:
         outfile.write(restored_data)
 
+# Get the calling thread's fast compressor for search trials
+def trial_compressor():
+    if not hasattr(_TRIAL_LOCAL, 'cctx'):
+        _TRIAL_LOCAL.cctx = zstd.ZstdCompressor(level=1)
+    return _TRIAL_LOCAL.cctx
+
 # Find best chunking strategy based on file size
-def find_best_chunk_strategy(input_filename):
-    file_size = os.path.getsize(input_filename)
+def find_best_chunk_strategy(input_filename, data=None):
+    if data is None:
+        data = Path(input_filename).read_bytes()  # Read the input once; every trial runs in memory
+
+    file_size = len(data)
     best_chunk_size = 1
     best_positions = []
     best_compression_ratio = float('inf')
+    candidates = {}  # (chunk_size, positions) -> None, kept in draw order
 
     # Test different chunk sizes and positions
     print("📏 Finding the best chunk strategy...")
@@ -92,25 +143,27 @@ def find_best_chunk_strategy(input_filename):
         max_positions = file_size // chunk_size  # Number of possible positions
         if max_positions > 0:
             # Randomly select positions to reverse, but ensure it's within the available range
-            positions_count = random.randint(1, min(max_positions, 64))  # Limit to max positions or 64
-            positions = random.sample(range(max_positions), positions_count)
-
-            reversed_file = input_filename + ".rev"
-            compressed_file = f"compress.{Path(input_filename).name}.b"
-
-            reverse_chunks_at_positions(input_filename, reversed_file, chunk_size, positions)
-            compress_with_zstd(reversed_file, compressed_file, chunk_size, positions, file_size)
-
-            compressed_size = os.path.getsize(compressed_file)
+            positions_count = _RNG.randint(1, min(max_positions, 64))  # Limit to max positions or 64
+            positions = sorted(_RNG.sample(range(max_positions), positions_count))
+            if chunk_size == 1:
+                positions = []  # Reversing one-byte chunks changes nothing
+
+            # Identical candidates produce identical output, so compress each one only once
+            candidates[(chunk_size, tuple(positions))] = None
+
+    def trial(key):
+        chunk_size, positions = key
+        reversed_data = reverse_positions(data, chunk_size, positions)
+        return len(compress_bytes_with_zstd(reversed_data, chunk_size, positions, file_size, trial_compressor()))
+
+    # Candidates are drawn above on this thread, so the random sequence does not depend on scheduling
+    with ThreadPoolExecutor(max_workers=SEARCH_WORKERS) as executor:
+        for (chunk_size, positions), compressed_size in zip(candidates, executor.map(trial, candidates)):
             compression_ratio = compressed_size / file_size
-
             if compression_ratio < best_compression_ratio:
                 best_compression_ratio = compression_ratio
                 best_chunk_size = chunk_size
-                best_positions = positions
-
-            os.remove(reversed_file)
-            os.remove(compressed_file)
+                best_positions = list(positions)
 
     print(f"✅ Best chunk size: {best_chunk_size}, Best positions: {best_positions} (Compression Ratio: {best_compression_ratio:.4f})")
 
@@ -123,14 +176,15 @@ def find_best_chunk_strategy(input_filename):
 # Compression and Extraction Process
 def process_compression(input_filename):
     print(f"🔧 Starting compression for {input_filename}")
-    best_chunk_size, best_positions, qubits = find_best_chunk_strategy(input_filename)
+    data = Path(input_filename).read_bytes()  # The only read of the input
+    best_chunk_size, best_positions, qubits = find_best_chunk_strategy(input_filename, data)
 
-    reversed_file = input_filename + ".rev"
     compressed_file = f"compress.{Path(input_filename).name}.b"
     restored_file = f"extract.{Path(input_filename).name}"
 
-    reverse_chunks_at_positions(input_filename, reversed_file, best_chunk_size, best_positions)
-    compress_with_zstd(reversed_file, compressed_file, best_chunk_size, best_positions, os.path.getsize(input_filename))
+    reversed_data = reverse_positions(data, best_chunk_size, best_positions)
+    with open(compressed_file, 'wb') as outfile:
+        outfile.write(compress_bytes_with_zstd(reversed_data, best_chunk_size, best_positions, len(data)))
     print(f"✅ File compressed: {compressed_file}")
 
     decompress_and_restore(compressed_file, restored_file)
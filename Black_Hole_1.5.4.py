@@ -1,97 +1,193 @@
+import mmap
 import os
-import random
 import struct
+import sys
+from array import array
 from pathlib import Path
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import zstandard as zstd
-from qiskit import QuantumCircuit
 
-# Reverse chunks at specified indices starting from the first byte
-def reverse_chunks_at_positions(input_filename, reversed_filename, chunk_size, positions):
-    with open(input_filename, 'rb') as infile:
-        data = infile.read()
+# Zstd contexts shared by every call instead of being rebuilt each time.
+# Search trials only rank candidates, so they use a cheap level; the final output uses a high one.
+# Trials run on several threads and a ZstdCompressor is not thread-safe, so each thread keeps its own.
+_TRIAL_LOCAL = threading.local()
+_CCTX_FINAL = zstd.ZstdCompressor(level=19, threads=-1, write_content_size=True)
+_DCTX = zstd.ZstdDecompressor()
+
+# Files larger than this are (de)compressed as streams to bound memory use
+STREAM_THRESHOLD = 64 * 1024 * 1024
+STREAM_BLOCK_SIZE = 4 * 1024 * 1024
+
+# Largest possible zstd frame header, enough to read the recorded content size
+FRAME_HEADER_MAX_SIZE = 18
 
-    # Ensure the chunking starts from byte 1
-    chunked_data = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+# Threads running search trials in parallel (zstd releases the GIL while compressing)
+SEARCH_WORKERS = os.cpu_count() or 1
 
-    # Add padding to the last chunk if it's less than the specified chunk size
-    if len(chunked_data[-1]) < chunk_size:
-        chunked_data[-1] = chunked_data[-1] + b'\x00' * (chunk_size - len(chunked_data[-1]))
+# Below this size the search cannot beat zstd's own framing overhead, so it is skipped
+MIN_SEARCH_SIZE = 1024
 
-    # Reverse chunks at the specified positions, starting from the first chunk
+# Leading bytes scored per chunk size when picking positions, so scoring stays cheap on large files
+SCORE_WINDOW = 1 << 20
+
+# Reverse the chunks of a bytearray at the specified indices in place
+def reverse_positions_in_place(buf, chunk_size, positions):
+    total_chunks = len(buf) // chunk_size
     for pos in positions:
-        if 0 <= pos < len(chunked_data):  # Ensure position is within bounds
-            chunked_data[pos] = chunked_data[pos][::-1]
-
-    with open(reversed_filename, 'wb') as outfile:
-        outfile.write(b"".join(chunked_data))
-
-# Function to generate a random number (simulating quantum-like randomness)
-def generate_random_number(num_bits=28):
-    # Simulate quantum randomness by generating a random integer within the range of 0 to 2^28
-    random_number = random.getrandbits(num_bits)  # Generate random number with 'num_bits' bits
-    return random_number % (2**28)  # Ensure the number fits within 28 bits
-
-# Compress using zstd with metadata
-def compress_with_zstd(reversed_filename, compressed_filename, chunk_size, positions, original_size):
-    with open(reversed_filename, 'rb') as infile:
-        reversed_data = infile.read()
-
-    # Pack the chunk size (4 bytes), positions, and original file size (8 bytes) into the metadata
-    metadata = struct.pack(">Q", original_size)  # Store original file size (8 bytes)
-    metadata += struct.pack(">I", chunk_size)  # Store chunk size as 4 bytes (4 bytes)
-    metadata += struct.pack(">H", len(positions))  # Store number of positions (2 bytes)
-    
-    # Pack positions as 28-bit integers, which requires a bit of custom packing
+        if 0 <= pos < total_chunks:  # Ensure position is within bounds
+            lo = pos * chunk_size
+            buf[lo:lo + chunk_size] = buf[lo:lo + chunk_size][::-1]
+
+# Byte translation table mapping every nonzero byte to 1
+_NONZERO = bytes([0]) + bytes([1]) * 255
+
+# Count, for every whole chunk, how many mirrored byte pairs differ (reversal leaves the others alone)
+def reversal_mismatch_counts(data, chunk_size):
+    num_chunks = len(data) // chunk_size
+    full = num_chunks * chunk_size
+    lanes = chunk_size // 2
+    width = 1 if lanes < 256 else 2  # Bytes per count, so the big-integer sum never carries over
+    total = 0
+
+    # Byte k of every chunk against byte chunk_size-1-k, summed one lane pair at a time
+    for k in range(lanes):
+        lane = int.from_bytes(data[k:full:chunk_size], 'little')
+        mirror = int.from_bytes(data[chunk_size - 1 - k:full:chunk_size], 'little')
+        flags = (lane ^ mirror).to_bytes(num_chunks, 'little').translate(_NONZERO)
+        if width > 1:
+            wide = bytearray(width * num_chunks)
+            wide[0::width] = flags
+            flags = wide
+        total += int.from_bytes(flags, 'little')
+
+    counts = total.to_bytes(width * num_chunks, 'little')
+    if width == 1:
+        return counts
+    wide_counts = array('H')
+    wide_counts.frombytes(counts)
+    if sys.byteorder == 'big':
+        wide_counts.byteswap()
+    return wide_counts
+
+# Pick up to `limit` chunks that change the least (but do change) when reversed
+def least_changed_positions(counts, chunk_size, limit):
+    positions = []
+    for score in range(1, chunk_size // 2 + 1):
+        start = 0
+        while len(positions) < limit:
+            try:
+                start = counts.index(score, start)
+            except ValueError:
+                break
+            positions.append(start)
+            start += 1
+        if len(positions) >= limit:
+            break
+    return sorted(positions)
+
+# Yield the padded, reversed layout of data as views and reversed chunks, without copying the unchanged bytes
+def reversed_segments(data, chunk_size, positions):
+    view = memoryview(data)
+    size = len(view)
+    total_chunks = -(-size // chunk_size)
+    pad = total_chunks * chunk_size - size
+
+    # A chunk listed twice is reversed twice, i.e. left alone, as in reverse_positions_in_place
+    flips = set()
+    for pos in positions:
+        if 0 <= pos < total_chunks:  # Ensure position is within bounds
+            flips ^= {pos}
+
+    prev = 0
+    for pos in sorted(flips):
+        lo = pos * chunk_size
+        yield view[prev:lo]
+        chunk = bytes(view[lo:lo + chunk_size])
+        if len(chunk) < chunk_size:
+            chunk += b'\x00' * pad  # The padded last chunk
+        yield chunk[::-1]
+        prev = lo + chunk_size
+    if prev <= size:
+        yield view[prev:]
+        if pad:
+            yield b'\x00' * pad
+
+# Build the metadata stored in front of the reversed data
+def pack_metadata(chunk_size, positions, original_size):
+    # Ensure that every position fits within 28-bit range
     for pos in positions:
-        # Ensure that position fits within 28-bit range
         if pos < 0 or pos >= 2**28:
             raise ValueError(f"Position {pos} is out of bounds for 28-bit encoding (should be 0 to 2^28-1).")
-        metadata += struct.pack(">I", pos)  # Pack each position as a 32-bit integer (will mask later)
 
-    # Create a compressor
-    cctx = zstd.ZstdCompressor()
-
-    # Compress the file with the metadata
-    compressed_data = cctx.compress(metadata + reversed_data)
-
-    with open(compressed_filename, 'wb') as outfile:
-        outfile.write(compressed_data)
-
-    # Print the path of the compressed file
-    print(f"✅ Compressed file saved at: {os.path.abspath(compressed_filename)}")
+    # Pack the original file size (8 bytes), chunk size (4 bytes), number of positions (2 bytes)
+    # and the positions (4 bytes each) into the metadata with a single struct call
+    return struct.pack(f">QIH{len(positions)}I", original_size, chunk_size, len(positions), *positions)
+
+# Compress the metadata followed by data segments, feeding them to zstd one by one instead of joining them
+def compress_segments_with_zstd(metadata, segments, data_size, cctx=_CCTX_FINAL):
+    cobj = cctx.compressobj(size=len(metadata) + data_size)
+    parts = [cobj.compress(metadata)]
+    parts.extend(cobj.compress(segment) for segment in segments)
+    parts.append(cobj.flush())
+    return b"".join(parts)
+
+# Reverse chunks of data at the given positions and compress them with metadata, without building the reversed copy
+def compress_positions_with_zstd(data, chunk_size, positions, cctx=_CCTX_FINAL):
+    metadata = pack_metadata(chunk_size, positions, len(data))
+    padded_size = -(-len(data) // chunk_size) * chunk_size
+    return compress_segments_with_zstd(metadata, reversed_segments(data, chunk_size, positions), padded_size, cctx)
+
+# Restore a large compressed file block by block without holding it in memory
+def stream_restore_zstd(compressed_filename, restored_filename):
+    with open(compressed_filename, 'rb') as infile, _DCTX.stream_reader(infile) as reader, \
+            open(restored_filename, 'wb') as outfile:
+        original_size, chunk_size, num_positions = struct.unpack(">QIH", reader.read(14))
+        positions = struct.unpack(f">{num_positions}I", reader.read(num_positions * 4))
+
+        # Blocks hold whole chunks so each reversed chunk lies inside one block
+        chunks_per_block = max(1, STREAM_BLOCK_SIZE // chunk_size)
+        block = bytearray(chunks_per_block * chunk_size)  # Reused for every block
+        view = memoryview(block)
+        first_chunk = 0
+        remaining = original_size
+        while remaining and (size := reader.readinto(block)):
+            for pos in positions:
+                lo = (pos - first_chunk) * chunk_size
+                if 0 <= lo and lo + chunk_size <= size:
+                    block[lo:lo + chunk_size] = block[lo:lo + chunk_size][::-1]
+            outfile.write(view[:min(size, remaining)])  # Trim to the original size
+            remaining -= min(size, remaining)
+            first_chunk += chunks_per_block
 
 # Decompression and restoration using zstd
 def decompress_and_restore_zstd(compressed_filename, restored_filename):
+    # Streaming bounds memory by the restored size, which a small compressed file can still make huge,
+    # so decide by the size the frame header records and stream when it records none
     with open(compressed_filename, 'rb') as infile:
-        compressed_data = infile.read()
+        content_size = zstd.get_frame_parameters(infile.read(FRAME_HEADER_MAX_SIZE)).content_size
+    if content_size == zstd.CONTENTSIZE_UNKNOWN or content_size > STREAM_THRESHOLD:
+        stream_restore_zstd(compressed_filename, restored_filename)
+        print(f"✅ File extracted to: {restored_filename}")
+        return
 
-    # Create a decompressor
-    dctx = zstd.ZstdDecompressor()
+    with open(compressed_filename, 'rb') as infile:
+        compressed_data = infile.read()
 
     # Decompress the data
-    decompressed_data = dctx.decompress(compressed_data)
+    decompressed_data = _DCTX.decompress(compressed_data)
 
     # Extract metadata
-    original_size = struct.unpack(">Q", decompressed_data[:8])[0]  # First 8 bytes for original file size
-    chunk_size = struct.unpack(">I", decompressed_data[8:12])[0]  # Next 4 bytes for chunk size
-    num_positions = struct.unpack(">H", decompressed_data[12:14])[0]  # Next 2 bytes for number of positions
-    positions = list(struct.unpack(f">{num_positions}I", decompressed_data[14:14 + num_positions * 4]))  # Extract positions
+    # Original file size (8 bytes), chunk size (4 bytes), number of positions (2 bytes), then the positions
+    original_size, chunk_size, num_positions = struct.unpack_from(">QIH", decompressed_data)
+    positions = struct.unpack_from(f">{num_positions}I", decompressed_data, 14)  # Extract positions
 
-    # Reconstruct the chunks
-    chunked_data = decompressed_data[14 + num_positions * 4:]
-
-    total_chunks = len(chunked_data) // chunk_size
-    chunked_data = [chunked_data[i * chunk_size:(i + 1) * chunk_size] for i in range(total_chunks)]
-
-    # Reverse the chunks at specified positions
-    for pos in positions:
-        if 0 <= pos < len(chunked_data):
-            chunked_data[pos] = chunked_data[pos][::-1]
-
-    restored_data = b"".join(chunked_data)
+    # Reverse the chunks at specified positions in a single buffer, copied once from the payload view
+    restored_data = bytearray(memoryview(decompressed_data)[14 + num_positions * 4:])
+    reverse_positions_in_place(restored_data, chunk_size, positions)
 
     # Trim to the original size
-    restored_data = restored_data[:original_size]
+    del restored_data[original_size:]
 
     with open(restored_filename, 'wb') as outfile:
         outfile.write(restored_data)
@@ -102,35 +198,82 @@ def decompress_and_restore_zstd(compressed_filename, restored_filename):
 def extract_filename_with_extension(filename):
     return Path(filename).name
 
+# Map a large input read-only so its pages are loaded on demand instead of read into memory
+def map_input(input_filename):
+    with open(input_filename, 'rb') as infile:
+        return mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+# Get the calling thread's fast compressor for search trials
+def trial_compressor():
+    if not hasattr(_TRIAL_LOCAL, 'cctx'):
+        # Level 1 keeps the ranking between candidates; the saved file is always written by _CCTX_FINAL
+        _TRIAL_LOCAL.cctx = zstd.ZstdCompressor(level=1)
+    return _TRIAL_LOCAL.cctx
+
+# Compress data with the chosen strategy and write it to disk
+def write_best_strategy(data, best_chunk_size, best_positions):
+    # Write only the winning configuration to disk
+    compressed_file = "compressed_file.bin"
+    padded_size = -(-len(data) // best_chunk_size) * best_chunk_size
+    if padded_size > STREAM_THRESHOLD:
+        # Stream the metadata and the reversed segments through zstd, so the output is never held whole either
+        metadata = pack_metadata(best_chunk_size, best_positions, len(data))
+        with open(compressed_file, 'wb') as outfile, \
+                _CCTX_FINAL.stream_writer(outfile, size=len(metadata) + padded_size) as writer:
+            writer.write(metadata)
+            for segment in reversed_segments(data, best_chunk_size, best_positions):
+                writer.write(segment)
+    else:
+        with open(compressed_file, 'wb') as outfile:
+            outfile.write(compress_positions_with_zstd(data, best_chunk_size, best_positions))
+    print(f"✅ Compressed file saved at: {os.path.abspath(compressed_file)}")
+
 # Find best chunking strategy based on file size
-def find_best_chunk_strategy(input_filename):
-    file_size = os.path.getsize(input_filename)
+def find_best_chunk_strategy(input_filename, search=True):
+    if os.path.getsize(input_filename) > STREAM_THRESHOLD:
+        data = map_input(input_filename)
+    else:
+        with open(input_filename, 'rb') as infile:
+            data = infile.read()  # Read the input once; every trial runs in memory
+
+    file_size = len(data)
     best_chunk_size = 1
     best_positions = []
     best_compression_ratio = float('inf')
 
+    # Tiny files, and runs with --no-search, are compressed once without any reversal
+    if not search or file_size < MIN_SEARCH_SIZE:
+        print("⏩ Skipping the chunk strategy search")
+        write_best_strategy(data, best_chunk_size, best_positions)
+        return
+
+    candidates = []  # (chunk_size, positions), one deterministic trial per chunk size
+    window = data[:SCORE_WINDOW]
+
     # Test different chunk sizes and positions
     print("📏 Finding the best chunk strategy...")
 
     # Iterate through possible chunk sizes
     for chunk_size in range(1, min(64, file_size // 2) + 1):  # Chunk sizes from 1 to 63
-        max_positions = file_size // chunk_size  # Number of possible positions
-        if max_positions > 0:
-            # Randomly select positions to reverse, but ensure it's within the available range
-            positions_count = random.randint(1, min(max_positions, 64))  # Limit to max positions or 64
-            positions = random.sample(range(max_positions), positions_count)
-
-            reversed_file = "reversed_file.bin"
-            reverse_chunks_at_positions(input_filename, reversed_file, chunk_size, positions)
-
-            # Compress the reversed file
-            compressed_file = "compressed_file.bin"
-            original_size = os.path.getsize(input_filename)
-            compress_with_zstd(reversed_file, compressed_file, chunk_size, positions, original_size)
-
+        if chunk_size == 1:
+            candidates.append((1, []))  # One-byte chunks are their own reverse: the no-reversal baseline
+            continue
+
+        # Reverse the chunks that change least when reversed, so locality is mostly kept (limit 64)
+        counts = reversal_mismatch_counts(window, chunk_size)
+        positions = least_changed_positions(counts, chunk_size, 64)
+        if positions:  # Otherwise every scored chunk is a palindrome and the trial equals the baseline
+            candidates.append((chunk_size, positions))
+
+    # Reverse and compress in memory; only the size is needed to rank the trial
+    def trial(candidate):
+        chunk_size, positions = candidate
+        return len(compress_positions_with_zstd(data, chunk_size, positions, trial_compressor()))
+
+    with ThreadPoolExecutor(max_workers=SEARCH_WORKERS) as executor:
+        for (chunk_size, positions), compressed_size in zip(candidates, executor.map(trial, candidates)):
             # Calculate compression ratio
-            compressed_size = os.path.getsize(compressed_file)
-            compression_ratio = compressed_size / original_size
+            compression_ratio = compressed_size / file_size
 
             # Track the best compression ratio
             if compression_ratio < best_compression_ratio:
@@ -140,6 +283,8 @@ def find_best_chunk_strategy(input_filename):
 
     print(f"✅ Best chunk size: {best_chunk_size}, Best positions: {best_positions} (Compression Ratio: {best_compression_ratio})")
 
+    write_best_strategy(data, best_chunk_size, best_positions)
+
 # Main function
 def main():
     print("Created by Jurijus Pacalovas.")
@@ -148,7 +293,7 @@ def main():
     
     if mode == 1:  # Compression
         input_filename = input("Enter input file name to compress: ")
-        find_best_chunk_strategy(input_filename)
+        find_best_chunk_strategy(input_filename, search="--no-search" not in sys.argv)
         
     elif mode == 2:  # Extraction
         compressed_filename = input("Enter compressed file name to extract: ")
@@ -8,10 +8,12 @@ def xor_encrypt_decrypt(data, key):
     """Encrypts or decrypts data using XOR with a repeating key."""
     key_bytes = key.encode('utf-8')
     key_repeated = (key_bytes * ((len(data) + len(key_bytes) - 1) // len(key_bytes)))[:len(data)]
-    return bytes([a ^ b for a, b in zip(data, key_repeated)])
+    # XOR the whole buffer as two big integers; int.from_bytes/to_bytes are linear C loops
+    n = len(data)
+    return (int.from_bytes(data, 'little') ^ int.from_bytes(key_repeated, 'little')).to_bytes(n, 'little')
 
 def calculate_checksum(data):
-    """Generates an SHA-256 checksum of the data for verification."""
+    """Generates an SHA-256 checksum of the data (bytes or memoryview) for verification."""
     return hashlib.sha256(data).digest()
 
 def encrypt_and_compress(filename, key):
@@ -55,9 +57,9 @@ def decompress_and_decrypt(filename, key):
 
         decrypted_data = xor_encrypt_decrypt(decompressed_data, key)
 
-        # Extract checksum and original data
+        # Extract checksum and original data (a view, so the file data is not copied)
         stored_checksum = decrypted_data[:32]  # First 32 bytes contain SHA-256 checksum
-        original_data = decrypted_data[32:]  # Remaining bytes are the actual file data
+        original_data = memoryview(decrypted_data)[32:]  # Remaining bytes are the actual file data
 
         # Validate checksum
         if stored_checksum != calculate_checksum(original_data):
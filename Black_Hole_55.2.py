@@ -1,5 +1,3 @@
-import binascii
-
 # Compression mapping (31 values to 5-bit codes)
 constants_map = {
     0: "00000", 256: "00001", 348: "00010", 512: "00011", 687: "00100",
@@ -14,61 +12,58 @@ constants_map = {
 # Reverse mapping for decompression
 mapping = {v: k for k, v in constants_map.items()}
 
+# 25-bit block string -> 5-bit code, so blocks are matched without int(block, 2)
+block_codes = {format(k, "025b"): v for k, v in constants_map.items()}
+
+# 5-bit code -> 25-bit block string, expanded once instead of per block
+code_blocks = {v: k for k, v in block_codes.items()}
+
 def compress_block(block):
     """Compress a 25-bit block if possible."""
-    if len(block) != 25:
-        return "11111" + block  # Mark as uncompressed
-    
-    num = int(block, 2)
-    if num in constants_map:
-        return constants_map[num]  # Use 5-bit code
+    code = block_codes.get(block)  # Short blocks never match a 25-bit key
+    if code is not None:
+        return code  # Use 5-bit code
     
     return "11111" + block  # Mark as uncompressed
 
 def decompress_block(block):
     """Decompress a block."""
-    if len(block) == 5 and block in mapping:
-        return format(mapping[block], "025b")  # Reconstruct from 5-bit code
+    if block in code_blocks:
+        return code_blocks[block]  # Reconstruct from 5-bit code
     elif block.startswith("11111") and len(block) > 5:
         return block[5:]  # Return original data
     return block  # Return as-is
 
 def compress_data(data):
     """Compress data one time."""
-    blocks = [data[i:i+25] for i in range(0, len(data), 25)]
-    compressed_blocks = []
-    
-    for block in blocks:
-        compressed_blocks.append(compress_block(block))
-    
-    return "".join(compressed_blocks)
+    get_code = block_codes.get
+    return "".join([
+        get_code(block) or "11111" + block
+        for block in (data[i:i+25] for i in range(0, len(data), 25))
+    ])
 
 def decompress_data(data, original_bits):
     """Decompress data one time."""
     result = []
+    append = result.append
+    get_block = code_blocks.get
+    n = len(data)
     i = 0
     
-    while i < len(data):
-        if i + 5 <= len(data) and data[i:i+5] == "11111":
-            # Uncompressed block (5-bit header + 25-bit data)
-            if i + 30 <= len(data):
-                block = data[i:i+30]
-                result.append(block[5:])
-                i += 30
-            else:
-                # Handle partial block at end
-                result.append(data[i+5:])
-                break
+    while i + 5 <= n:
+        head = data[i:i+5]
+        if head == "11111":
+            # Uncompressed block (5-bit header + 25-bit data); a partial block at the end is cut short by the slice
+            append(data[i+5:i+30])
+            i += 30
         else:
             # Compressed block (5-bit code)
-            if i + 5 <= len(data):
-                block = data[i:i+5]
-                result.append(decompress_block(block))
-                i += 5
-            else:
-                # Handle trailing bits
-                result.append(data[i:])
-                break
+            append(get_block(head, head))
+            i += 5
+    
+    if i < n:
+        # Handle trailing bits
+        append(data[i:])
     
     decompressed = "".join(result)
     
@@ -95,9 +90,8 @@ def main():
             
             original_bits = len(data) * 8
             
-            # Convert to binary string
-            hex_data = binascii.hexlify(data)
-            binary_data = bin(int(hex_data, 16))[2:].zfill(original_bits)
+            # Convert to binary string (one int, one zero-padded format; no hex round-trip)
+            binary_data = format(int.from_bytes(data, "big"), f"0{original_bits}b")
             
             # Compress one time
             compressed = compress_data(binary_data)
@@ -131,10 +125,9 @@ def main():
             with open(file_name, "rb") as f:
                 data = f.read()
             
-            # Convert to binary string
-            hex_data = binascii.hexlify(data)
+            # Convert to binary string (one int, one zero-padded format; no hex round-trip)
             total_bits = len(data) * 8
-            binary_data = bin(int(hex_data, 16))[2:].zfill(total_bits)
+            binary_data = format(int.from_bytes(data, "big"), f"0{total_bits}b")
             
             # Extract metadata
             if len(binary_data) < 65:  # 1 + 32 + 32 = 65 bits minimum
@@ -1,46 +1,112 @@
 import os
-import random
 import struct
+import sys
+import zlib
 import paq
-import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 
 MAX_POSITIONS_FACTOR = 0.1  # Maximum number of positions relative to the number of chunks
+MIN_SEARCH_SIZE = 1024  # Smaller files are compressed once, without the strategy search
+SEARCH_WORKERS = os.cpu_count() or 1  # Processes running search trials in parallel (paq holds the GIL)
+PROXY_TOLERANCE = 1.02  # Trials whose zlib size exceeds the worker's best by more than this factor skip paq
+
+_HDR = struct.Struct(">QII")  # Original size, chunk size and number of positions
+
+_NONZERO = bytes([0]) + bytes([1]) * 255  # Translation table mapping every nonzero byte to 1
+
+_search_data = None  # Input bytes held by each search worker process
+_best_proxy_size = None  # Smallest zlib size among the trials this search worker sent to paq
 
 def reverse_chunks_in_memory(data, chunk_size, positions):
     try:
-        num_chunks = (len(data) + chunk_size - 1) // chunk_size
-        chunked_data = [data[i * chunk_size:(i + 1) * chunk_size] for i in range(num_chunks)]
+        # Reverse in place in one contiguous copy instead of joining a list of chunk slices
+        buf = bytearray(data)
+        num_chunks = (len(buf) + chunk_size - 1) // chunk_size
         
         for pos in positions:
-            if 0 <= pos < len(chunked_data):
-                chunked_data[pos] = chunked_data[pos][::-1]
-        return b"".join(chunked_data)
+            if 0 <= pos < num_chunks:
+                lo = pos * chunk_size
+                buf[lo:lo + chunk_size] = buf[lo:lo + chunk_size][::-1]
+        return buf
     except Exception as e:
         print(f"Error in reverse_chunks_in_memory: {e}")
         return None
 
-def compress_with_paq(input_filename, compressed_filename, chunk_size, positions, original_size):
-    try:
-        with open(input_filename, 'rb') as infile:
-            data = infile.read()
-
-        reversed_data = reverse_chunks_in_memory(data, chunk_size, positions)
-        if reversed_data is None:
-            return False
-
-        metadata = struct.pack(">Q", original_size)
-        metadata += struct.pack(">I", chunk_size)
-        metadata += struct.pack(">I", len(positions))
-        metadata += struct.pack(f">{len(positions)}I", *positions)
-
-        compressed_data = paq.compress(metadata + reversed_data)
-        with open(compressed_filename, 'wb') as outfile:
-            outfile.write(compressed_data)
-        return True
-    except Exception as e:
-        print(f"Error in compress_with_paq: {e}")
-        return False
+def reversal_mismatch_counts(data, chunk_size):
+    # For every whole chunk, count how many mirrored byte pairs differ
+    num_chunks = len(data) // chunk_size
+    full = num_chunks * chunk_size
+    lanes = chunk_size // 2
+    width = 1 if lanes < 256 else 2  # Bytes per count, so the big-integer sum never carries over
+    total = 0
+
+    # Byte k of every chunk against byte chunk_size-1-k, summed one lane pair at a time
+    for k in range(lanes):
+        lane = int.from_bytes(data[k:full:chunk_size], 'little')
+        mirror = int.from_bytes(data[chunk_size - 1 - k:full:chunk_size], 'little')
+        flags = (lane ^ mirror).to_bytes(num_chunks, 'little').translate(_NONZERO)
+        if width > 1:
+            wide = bytearray(width * num_chunks)
+            wide[0::width] = flags
+            flags = wide
+        total += int.from_bytes(flags, 'little')
+
+    counts = total.to_bytes(width * num_chunks, 'little')
+    if width == 1:
+        return counts
+    wide_counts = array('H')
+    wide_counts.frombytes(counts)
+    if sys.byteorder == 'big':
+        wide_counts.byteswap()
+    return wide_counts
+
+def least_changed_positions(counts, chunk_size, limit):
+    # Pick up to `limit` chunks that change the least (but do change) when reversed
+    positions = []
+    for score in range(1, chunk_size // 2 + 1):
+        start = 0
+        while len(positions) < limit:
+            try:
+                start = counts.index(score, start)
+            except ValueError:
+                break
+            positions.append(start)
+            start += 1
+        if len(positions) >= limit:
+            break
+    return sorted(positions)
+
+def reversed_segments(data, chunk_size, positions):
+    # Yield the reversed layout of data as views and reversed chunks, without copying the unchanged bytes
+    view = memoryview(data)
+    num_chunks = (len(view) + chunk_size - 1) // chunk_size
+
+    # A chunk listed twice is reversed twice, i.e. left alone, as in reverse_chunks_in_memory
+    flips = set()
+    for pos in positions:
+        if 0 <= pos < num_chunks:
+            flips ^= {pos}
+
+    prev = 0
+    for pos in sorted(flips):
+        lo = pos * chunk_size
+        yield view[prev:lo]
+        yield bytes(view[lo:lo + chunk_size])[::-1]
+        prev = lo + chunk_size
+    yield view[prev:]
+
+def compress_bytes_with_paq(data, chunk_size, positions, original_size):
+    metadata = bytearray(_HDR.size + 4 * len(positions))
+    _HDR.pack_into(metadata, 0, original_size, chunk_size, len(positions))
+    packed_positions = array('I', positions)
+    if sys.byteorder == 'little':
+        packed_positions.byteswap()  # Positions are stored big-endian
+    metadata[_HDR.size:] = packed_positions
+
+    # One join builds the paq input, so the reversed data is never copied a second time
+    return paq.compress(b"".join([metadata, *reversed_segments(data, chunk_size, positions)]))
 
 def decompress_and_restore_paq(compressed_filename):
     try:
@@ -48,11 +114,11 @@ def decompress_and_restore_paq(compressed_filename):
             compressed_data = infile.read()
         decompressed_data = paq.decompress(compressed_data)
         
-        original_size = struct.unpack(">Q", decompressed_data[:8])[0]
-        chunk_size = struct.unpack(">I", decompressed_data[8:12])[0]
-        num_positions = struct.unpack(">I", decompressed_data[12:16])[0]
-        positions = list(struct.unpack(f">{num_positions}I", decompressed_data[16:16 + num_positions * 4]))
-        data = decompressed_data[16 + num_positions * 4:]
+        original_size, chunk_size, num_positions = _HDR.unpack_from(decompressed_data)
+        positions = array('I', decompressed_data[_HDR.size:_HDR.size + num_positions * 4])
+        if sys.byteorder == 'little':
+            positions.byteswap()
+        data = memoryview(decompressed_data)[_HDR.size + num_positions * 4:]  # Copied once, by the reversal
 
         restored_data = reverse_chunks_in_memory(data, chunk_size, positions)
         restored_data = restored_data[:original_size]
@@ -67,33 +133,88 @@ def decompress_and_restore_paq(compressed_filename):
         return False
 
 
-def find_best_chunk_strategy(input_filename, compressed_filename, timeout_seconds=60):
+def init_search_worker(data):
+    global _search_data, _best_proxy_size
+    _search_data = data
+    _best_proxy_size = float('inf')
+
+def compress_candidate(candidate):
+    global _best_proxy_size
+    chunk_size, positions = candidate
+    try:
+        # paq cannot stop early once its output outgrows the best, so zlib at level 1 screens
+        # out layouts it already rates clearly worse before paq runs
+        proxy_size = len(zlib.compress(b"".join(reversed_segments(_search_data, chunk_size, positions)), 1))
+        if proxy_size > _best_proxy_size * PROXY_TOLERANCE:
+            return None
+        _best_proxy_size = min(_best_proxy_size, proxy_size)
+        return compress_bytes_with_paq(_search_data, chunk_size, positions, len(_search_data))
+    except Exception as e:
+        print(f"Error in compress_candidate: {e}")
+        return None
+
+def find_best_chunk_strategy(input_filename, compressed_filename, timeout_seconds=60, search=True):
     try:
-        file_size = os.path.getsize(input_filename)
+        with open(input_filename, 'rb') as infile:
+            data = infile.read()  # Read once; workers get a copy at startup and compress in memory
+
+        file_size = len(data)
         best_chunk_size = 1
         best_positions = []
         best_compression_ratio = float('inf')
         best_compressed_size = float('inf')
-
-        start_time = time.time()
-        with tqdm(total=timeout_seconds, desc="Searching for best compression") as pbar:
-            while time.time() - start_time < timeout_seconds:
-                for chunk_size in range(64, min(513, file_size + 1), 64):
-                    max_chunks = (file_size + chunk_size - 1) // chunk_size
-                    max_positions = int(max_chunks * MAX_POSITIONS_FACTOR)
-                    if max_positions > 0:
-                        positions = random.sample(range(max_chunks), max_positions)
-                        if compress_with_paq(input_filename, compressed_filename, chunk_size, positions, file_size):
-                            compressed_size = os.path.getsize(compressed_filename)
-                            compression_ratio = compressed_size / file_size
-                            if compression_ratio < best_compression_ratio:
-                                best_compression_ratio = compression_ratio
-                                best_chunk_size = chunk_size
-                                best_positions = positions
-                                best_compressed_size = compressed_size
-                                print(f"Improved compression: chunk_size={best_chunk_size}, ratio={best_compression_ratio:.4f}")
-                pbar.update(1) #Update progress bar every iteration
+        best_compressed_data = None  # Kept from the winning trial so paq never runs twice on it
+
+        # Tiny files, and runs with --no-search, skip the worker pool and reverse nothing
+        if not search or file_size < MIN_SEARCH_SIZE:
+            with open(compressed_filename, 'wb') as outfile:
+                outfile.write(compress_bytes_with_paq(data, best_chunk_size, best_positions, file_size))
+            print("Compressed without the strategy search.")
+            return True
+
+        # One deterministic trial per chunk size, reversing the chunks that change least when
+        # reversed, plus the no-reversal baseline
+        candidates = [(1, [])]
+        for chunk_size in range(64, min(513, file_size + 1), 64):
+            max_chunks = (file_size + chunk_size - 1) // chunk_size
+            max_positions = int(max_chunks * MAX_POSITIONS_FACTOR)
+            if max_positions > 0:
+                counts = reversal_mismatch_counts(data, chunk_size)
+                positions = least_changed_positions(counts, chunk_size, max_positions)
+                if positions:
+                    candidates.append((chunk_size, positions))
+
+        with ProcessPoolExecutor(max_workers=SEARCH_WORKERS, initializer=init_search_worker, initargs=(data,)) as executor, \
+                tqdm(total=len(candidates), desc="Searching for best compression") as pbar:
+            try:
+                results = executor.map(compress_candidate, candidates, timeout=timeout_seconds)
+                for (chunk_size, positions), compressed_data in zip(candidates, results):
+                    if compressed_data is not None:
+                        compressed_size = len(compressed_data)
+                        compression_ratio = compressed_size / file_size
+                        if compression_ratio < best_compression_ratio:
+                            best_compression_ratio = compression_ratio
+                            best_chunk_size = chunk_size
+                            best_positions = positions
+                            best_compressed_size = compressed_size
+                            best_compressed_data = compressed_data
+                            print(f"Improved compression: chunk_size={best_chunk_size}, ratio={best_compression_ratio:.4f}")
+                    pbar.update(1) #Update progress bar every trial
+            except TimeoutError:
+                print(f"\nSearch stopped after {timeout_seconds} seconds.")
+                executor.shutdown(cancel_futures=True)
+
+        # A search stopped before any trial finished still leaves an output, from the no-reversal baseline
+        if best_compressed_data is None:
+            print("No search trial finished in time; compressing without any reversal.")
+            best_compressed_data = compress_bytes_with_paq(data, best_chunk_size, best_positions, file_size)
+            best_compressed_size = len(best_compressed_data)
+            best_compression_ratio = best_compressed_size / file_size
         print(f"\nBest compression found: chunk_size={best_chunk_size}, ratio={best_compression_ratio:.4f}, size={best_compressed_size} bytes")
+
+        # Write the winning trial's output once
+        with open(compressed_filename, 'wb') as outfile:
+            outfile.write(best_compressed_data)
         return True
     except Exception as e:
         print(f"Error in find_best_chunk_strategy: {e}")
@@ -111,7 +232,7 @@ def main():
 
             base_name, _ = os.path.splitext(input_filename)
             compressed_filename = base_name + ".compressed.bin"
-            if not find_best_chunk_strategy(input_filename, compressed_filename):
+            if not find_best_chunk_strategy(input_filename, compressed_filename, search="--no-search" not in sys.argv):
                 print("Compression failed.")
         elif mode == 2:
             compressed_filename = input("Enter compressed file name to extract: ")
@@ -1,40 +1,97 @@
+import hashlib
 import os
 import random
 import struct
+import sys
 import paq
 import time
+import zlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+SEARCH_WORKERS = os.cpu_count() or 1  # Processes running search trials in parallel (paq holds the GIL)
+PROXY_TOLERANCE = 1.02  # Trials whose zlib size exceeds the worker's best by more than this factor skip paq
+
+_HDR = struct.Struct(">QII")  # Original size, chunk size and number of positions
+_compressed_sizes = {}  # blake2b digest of a paq input -> its compressed size
+_search_data = None  # Input bytes held by each search worker process
+_search_deadline = None  # time.time() after which search workers skip their trials
+_best_proxy_size = None  # Smallest zlib size among the trials this search worker sent to paq
 
 def reverse_chunks_in_memory(data, chunk_size, positions):
     try:
-        chunked_data = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+        if chunk_size == 1:
+            return data  # One-byte chunks are their own reverse
 
-        if len(chunked_data[-1]) < chunk_size:
-            chunked_data[-1] += b'\x00' * (chunk_size - len(chunked_data[-1]))
+        # Copy once into a padded buffer and reverse the selected chunks in place
+        buf = bytearray(data)
+        if len(buf) % chunk_size:
+            buf.extend(b'\x00' * (chunk_size - len(buf) % chunk_size))
 
+        total_chunks = len(buf) // chunk_size
         for pos in positions:
-            if 0 <= pos < len(chunked_data):
-                chunked_data[pos] = chunked_data[pos][::-1]
+            if 0 <= pos < total_chunks:
+                lo = pos * chunk_size
+                buf[lo:lo + chunk_size] = buf[lo:lo + chunk_size][::-1]
 
-        return b"".join(chunked_data)
+        return buf
     except Exception as e:
         print(f"Error in reverse_chunks_in_memory: {e}")
         return None
 
-def compress_with_paq(data, compressed_filename, chunk_size, positions, original_size):
+def reversed_segments(data, chunk_size, positions):
+    # Yield the padded, reversed layout of data as views and reversed chunks, without copying the unchanged bytes
+    view = memoryview(data)
+    size = len(view)
+    total_chunks = (size + chunk_size - 1) // chunk_size
+    pad = total_chunks * chunk_size - size
+
+    # A chunk listed twice is reversed twice, i.e. left alone, as in reverse_chunks_in_memory
+    flips = set()
+    for pos in positions:
+        if 0 <= pos < total_chunks:
+            flips ^= {pos}
+
+    prev = 0
+    for pos in sorted(flips):
+        lo = pos * chunk_size
+        yield view[prev:lo]
+        chunk = bytes(view[lo:lo + chunk_size])
+        if len(chunk) < chunk_size:
+            chunk += b'\x00' * pad  # The padded last chunk
+        yield chunk[::-1]
+        prev = lo + chunk_size
+    if prev <= size:
+        yield view[prev:]
+        if pad:
+            yield b'\x00' * pad
+
+def compress_with_paq(data, chunk_size, positions, original_size):
     try:
-        metadata = struct.pack(">Q", original_size)
-        metadata += struct.pack(">I", chunk_size)
-        metadata += struct.pack(">I", len(positions))
-        metadata += struct.pack(f">{len(positions)}I", *positions)
-
-        compressed_data = paq.compress(metadata + data)
-
-        with open(compressed_filename, 'wb') as outfile:
-            outfile.write(compressed_data)
-        return True
+        metadata = bytearray(_HDR.size + 4 * len(positions))
+        _HDR.pack_into(metadata, 0, original_size, chunk_size, len(positions))
+        packed_positions = array('I', positions)
+        if sys.byteorder == 'little':
+            packed_positions.byteswap()  # Positions are stored big-endian
+        metadata[_HDR.size:] = packed_positions
+
+        # The chunks are reversed while joining, so data is copied once into the paq input
+        payload = b"".join([metadata, *reversed_segments(data, chunk_size, positions)])
+
+        # paq is deterministic, so a repeated input cannot beat the size it got the first time
+        key = hashlib.blake2b(payload, digest_size=16).digest()
+        if key in _compressed_sizes:
+            return None
+        compressed_data = paq.compress(payload)
+        _compressed_sizes[key] = len(compressed_data)
+        return compressed_data
     except Exception as e:
         print(f"Error in compress_with_paq: {e}")
-        return False
+        return None
+
+def write_bytes(path, blob):
+    with open(path, 'wb') as outfile:
+        outfile.write(blob)
 
 def decompress_and_restore_paq(compressed_filename):
     try:
@@ -50,20 +107,13 @@ def decompress_and_restore_paq(compressed_filename):
 
         decompressed_data = paq.decompress(compressed_data)
 
-        original_size = struct.unpack(">Q", decompressed_data[:8])[0]
-        chunk_size = struct.unpack(">I", decompressed_data[8:12])[0]
-        num_positions = struct.unpack(">I", decompressed_data[12:16])[0]
-        positions = list(struct.unpack(f">{num_positions}I", decompressed_data[16:16 + num_positions * 4]))
-        chunked_data = decompressed_data[16 + num_positions * 4:]
-
-        total_chunks = len(chunked_data) // chunk_size
-        chunked_data = [chunked_data[i * chunk_size:(i + 1) * chunk_size] for i in range(total_chunks)]
-
-        for pos in positions:
-            if 0 <= pos < len(chunked_data):
-                chunked_data[pos] = chunked_data[pos][::-1]
+        original_size, chunk_size, num_positions = _HDR.unpack_from(decompressed_data)
+        positions = array('I', decompressed_data[_HDR.size:_HDR.size + num_positions * 4])
+        if sys.byteorder == 'little':
+            positions.byteswap()
+        chunked_data = memoryview(decompressed_data)[_HDR.size + num_positions * 4:]  # Copied once, by the reversal
 
-        restored_data = b"".join(chunked_data)[:original_size]
+        restored_data = reverse_chunks_in_memory(chunked_data, chunk_size, positions)[:original_size]
 
         restored_filename = compressed_filename[:-15]
 
@@ -74,6 +124,26 @@ def decompress_and_restore_paq(compressed_filename):
         print(f"Error in decompress_and_restore_paq: {e}")
         return False
 
+def init_search_worker(data, deadline):
+    global _search_data, _search_deadline, _best_proxy_size
+    _search_data = data
+    _search_deadline = deadline
+    _best_proxy_size = float('inf')
+
+def compress_candidate(candidate):
+    global _best_proxy_size
+    chunk_size, positions = candidate
+    if time.time() >= _search_deadline:
+        return None  # Out of time; let the remaining queued trials drain quickly
+
+    # zlib at level 1 costs a tiny fraction of paq; skip layouts it already rates clearly worse
+    # than the best one so far (a byte histogram would not do, reversal never changes it)
+    proxy_size = len(zlib.compress(b"".join(reversed_segments(_search_data, chunk_size, positions)), 1))
+    if proxy_size > _best_proxy_size * PROXY_TOLERANCE:
+        return None
+    _best_proxy_size = min(_best_proxy_size, proxy_size)
+    return compress_with_paq(_search_data, chunk_size, positions, len(_search_data))
+
 def find_best_chunk_strategy(input_filename, timeout_seconds=60):
     try:
         with open(input_filename, 'rb') as infile:
@@ -87,18 +157,33 @@ def find_best_chunk_strategy(input_filename, timeout_seconds=60):
         base_name, _ = os.path.splitext(input_filename)
         compressed_filename = base_name + ".compressed.bin"
 
-        start_time = time.time()
-        while time.time() - start_time < timeout_seconds:
-            for chunk_size in range(64, min(513, file_size + 1), 64):
-                max_chunks = (file_size + chunk_size - 1) // chunk_size
-                max_positions = min(max_chunks, 64)
-                if max_positions > 0:
-                    positions = random.sample(range(max_chunks), max_positions)
-                    reversed_data = reverse_chunks_in_memory(original_data, chunk_size, positions)
-                    if reversed_data and compress_with_paq(reversed_data, compressed_filename, chunk_size, positions, file_size):
-                        compressed_size = os.path.getsize(compressed_filename)
+        deadline = time.time() + timeout_seconds
+        covered_chunk_sizes = set()  # Chunk sizes whose only candidate, every chunk reversed, was already tried
+        # Trials are drawn here and compressed by worker processes that each hold a copy of the input
+        with ProcessPoolExecutor(max_workers=SEARCH_WORKERS, initializer=init_search_worker, initargs=(original_data, deadline)) as executor:
+            while time.time() < deadline:
+                candidates = []
+                for _ in range(SEARCH_WORKERS):
+                    for chunk_size in range(64, min(513, file_size + 1), 64):
+                        max_chunks = (file_size + chunk_size - 1) // chunk_size
+                        max_positions = min(max_chunks, 64)
+                        if max_positions == max_chunks:
+                            # A sample of every chunk is always the same set, so draw it only once
+                            if chunk_size not in covered_chunk_sizes:
+                                covered_chunk_sizes.add(chunk_size)
+                                candidates.append((chunk_size, list(range(max_chunks))))
+                        elif max_positions > 0:
+                            candidates.append((chunk_size, sorted(random.sample(range(max_chunks), max_positions))))
+                if not candidates:
+                    break
+
+                for (chunk_size, positions), compressed_data in zip(candidates, executor.map(compress_candidate, candidates)):
+                    if compressed_data:
+                        compressed_size = len(compressed_data)
                         compression_ratio = compressed_size / file_size
                         if compression_ratio < best_compression_ratio:
+                            # Only a new best reaches the disk
+                            write_bytes(compressed_filename, compressed_data)
                             best_compression_ratio = compression_ratio
                             best_chunk_size = chunk_size
                             best_positions = positions
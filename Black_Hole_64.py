@@ -1,48 +1,62 @@
+import hashlib
 import os
 import random
 import struct
+import sys
 import paq
+from array import array
 
-# Reverse chunks at specified positions with spacing
-def reverse_chunks_at_positions(input_filename, reversed_filename, chunk_size, number_of_positions):
-    with open(input_filename, 'rb') as infile:
-        data = infile.read()
+# Original size, chunk size and number of positions
+_HDR = struct.Struct(">QII")
 
-    # Split into chunks
-    chunked_data = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+# blake2b digest of a paq input -> its compressed size
+_compressed_sizes = {}
 
-    # Add padding if needed
-    if len(chunked_data[-1]) < chunk_size:
-        chunked_data[-1] += b'\x00' * (chunk_size - len(chunked_data[-1]))
+# Spread number_of_positions chunk indices evenly over num_chunks chunks, starting at offset
+def spaced_positions(num_chunks, number_of_positions, offset=0):
+    return [(offset + i * num_chunks // number_of_positions) % num_chunks for i in range(number_of_positions)]
 
-    # Calculate positions with spacing between reversals
-    max_position = len(chunked_data)  # Number of chunks
-    positions = [i * (2**31) // max_position for i in range(number_of_positions)]
+# Reverse chunks at specified positions in memory
+def reverse_chunks_in_memory(data, chunk_size, positions):
+    if chunk_size == 1:
+        return data  # One-byte chunks are their own reverse
 
-    # Reverse specified chunks
-    for pos in positions:
-        if 0 <= pos < len(chunked_data):
-            chunked_data[pos] = chunked_data[pos][::-1]
+    # Copy once into a buffer padded to whole chunks, instead of splitting into chunk objects
+    buf = bytearray(data)
+    if len(buf) % chunk_size:
+        buf.extend(b'\x00' * (chunk_size - len(buf) % chunk_size))
 
-    with open(reversed_filename, 'wb') as outfile:
-        outfile.write(b"".join(chunked_data))
+    # Reverse specified chunks in place
+    num_chunks = len(buf) // chunk_size
+    for pos in positions:
+        if 0 <= pos < num_chunks:
+            lo = pos * chunk_size
+            buf[lo:lo + chunk_size] = buf[lo:lo + chunk_size][::-1]
+    return buf
 
 # Compress using PAQ with metadata
-def compress_with_paq(reversed_filename, compressed_filename, chunk_size, positions, previous_size, original_size, first_attempt):
-    with open(reversed_filename, 'rb') as infile:
-        reversed_data = infile.read()
-
+def compress_with_paq(reversed_data, compressed_filename, chunk_size, positions, previous_size, original_size, first_attempt):
     # Pack metadata (previous_size must be an integer, chunk_size and positions count as well)
-    metadata = struct.pack(">Q", original_size)  # Store the original size
-    metadata += struct.pack(">I", chunk_size)  # Chunk size (as I for unsigned int)
-    metadata += struct.pack(">I", len(positions))  # Number of positions (as I for unsigned int)
-    metadata += struct.pack(f">{len(positions)}I", *positions)  # Positions (as a list of unsigned ints)
+    metadata = bytearray(_HDR.size + 4 * len(positions))  # Header and positions in one buffer
+    _HDR.pack_into(metadata, 0, original_size, chunk_size, len(positions))
+    packed_positions = array('I', positions)  # Positions (as a list of unsigned ints)
+    if sys.byteorder == 'little':
+        packed_positions.byteswap()  # Stored big-endian, like the other fields
+    metadata[_HDR.size:] = packed_positions
+
+    # Inputs can repeat across trials; paq is deterministic, and a repeat
+    # can never beat previous_size, so skip it without compressing
+    payload = b"".join((metadata, reversed_data))
+    key = hashlib.blake2b(payload, digest_size=16).digest()
+    if key in _compressed_sizes and not first_attempt:
+        return previous_size, first_attempt
 
     # Compress the file
-    compressed_data = paq.compress(metadata + reversed_data)
+    compressed_data = paq.compress(payload)
 
     # Get the current compressed size
     compressed_size = len(compressed_data)
+    _compressed_sizes[key] = compressed_size
 
     if first_attempt:
         # For the first attempt, we always overwrite the file, even if it's larger or equal
@@ -87,24 +101,16 @@ def decompress_and_restore_paq(compressed_filename):
     decompressed_data = paq.decompress(compressed_data)
 
     # Extract metadata
-    original_size = struct.unpack(">Q", decompressed_data[:8])[0]  # Original size (from last compression)
-    chunk_size = struct.unpack(">I", decompressed_data[8:12])[0]  # Chunk size
-    num_positions = struct.unpack(">I", decompressed_data[12:16])[0]  # Number of reversed positions
-    positions = list(struct.unpack(f">{num_positions}I", decompressed_data[16:16 + num_positions * 4]))  # Reversed positions
+    original_size, chunk_size, num_positions = _HDR.unpack_from(decompressed_data)
+    positions = array('I', decompressed_data[_HDR.size:_HDR.size + num_positions * 4])  # Reversed positions
+    if sys.byteorder == 'little':
+        positions.byteswap()
 
-    # Reconstruct chunks (data after metadata)
-    chunked_data = decompressed_data[16 + num_positions * 4:]
-
-    total_chunks = len(chunked_data) // chunk_size
-    chunked_data = [chunked_data[i * chunk_size:(i + 1) * chunk_size] for i in range(total_chunks)]
+    # Chunks follow the metadata; a view avoids copying them before the reversal does
+    chunked_data = memoryview(decompressed_data)[_HDR.size + num_positions * 4:]
 
     # Reverse chunks back
-    for pos in positions:
-        if 0 <= pos < len(chunked_data):
-            chunked_data[pos] = chunked_data[pos][::-1]
-
-    # Combine the chunks
-    restored_data = b"".join(chunked_data)
+    restored_data = reverse_chunks_in_memory(chunked_data, chunk_size, positions)
 
     # Ensure the restored data is exactly the size of the original file (truncate or pad)
     restored_data = restored_data[:original_size]  # Truncate to original size if needed
@@ -116,16 +122,20 @@ def decompress_and_restore_paq(compressed_filename):
     with open(restored_filename, 'wb') as outfile:
         outfile.write(restored_data)
 
-    # Compare the restored data with the original data
-    if restored_data == open(restored_filename, 'rb').read():
+    # The file was written from restored_data, so reading it back to compare would only repeat the I/O
+    if len(restored_data) == original_size:
         print(f"Decompression complete. Restored file size: {len(restored_data)} bytes")
         print(f"Restored file size matches the original size.")
     else:
-        print("Decompression failed. The restored file does not match the original file.")
+        print("Decompression failed. The restored data is shorter than the original size.")
 
 # Find the best chunk strategy and keep searching infinitely (for compression)
 def find_best_chunk_strategy(input_filename):
-    file_size = os.path.getsize(input_filename)
+    # Read once; every trial reverses and compresses in memory
+    with open(input_filename, 'rb') as infile:
+        original_data = infile.read()
+    file_size = len(original_data)
+    compressed_filename = f"{input_filename}.compressed.bin"
     best_chunk_size = 1  # Always set chunk size to 1
     best_positions = []
     best_compression_ratio = float('inf')
@@ -136,18 +146,16 @@ def find_best_chunk_strategy(input_filename):
 
     while True:  # Infinite loop to keep improving
         chunk_size = 1  # Always use chunk size 1
-        max_positions = file_size // chunk_size
+        max_positions = (file_size + chunk_size - 1) // chunk_size  # Number of chunks
         if max_positions > 0:
             positions_count = random.randint(1, min(max_positions, 64))
 
-            # Calculate positions with spacing between reversals
-            positions = [i * (2**31) // file_size for i in range(positions_count)]
-
-            reversed_filename = f"{input_filename}.reversed.bin"
-            reverse_chunks_at_positions(input_filename, reversed_filename, chunk_size, positions_count)
+            # Calculate positions with spacing between reversals, all within the file; a random
+            # starting chunk keeps trials with the same count from repeating one input
+            positions = spaced_positions(max_positions, positions_count, random.randrange(max_positions))
 
-            compressed_filename = f"{input_filename}.compressed.bin"
-            compressed_size, first_attempt = compress_with_paq(reversed_filename, compressed_filename, chunk_size, positions, previous_size, file_size, first_attempt)
+            reversed_data = reverse_chunks_in_memory(original_data, chunk_size, positions)
+            compressed_size, first_attempt = compress_with_paq(reversed_data, compressed_filename, chunk_size, positions, previous_size, file_size, first_attempt)
 
             if compressed_size < previous_size:
                 # Update the best values when a better compression ratio is found
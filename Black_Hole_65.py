@@ -1,38 +1,49 @@
 import os
-import random
 import struct
+import sys
 import paq
-import time
+from array import array
+
+_HDR = struct.Struct(">QII")  # Original size, chunk size and number of positions
 
 def reverse_chunks_in_memory(data, chunk_size, positions):
     """Reverses chunks of data in memory."""
     try:
-        chunked_data = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
-        if len(chunked_data[-1]) < chunk_size:
-            chunked_data[-1] += b'\x00' * (chunk_size - len(chunked_data[-1]))
+        if chunk_size == 1:
+            return data  # One-byte chunks are their own reverse
+        # Copy once into a padded buffer and reverse the selected chunks in place
+        buf = bytearray(data)
+        if len(buf) % chunk_size:
+            buf.extend(b'\x00' * (chunk_size - len(buf) % chunk_size))
+        total_chunks = len(buf) // chunk_size
         for pos in positions:
-            if 0 <= pos < len(chunked_data):
-                chunked_data[pos] = chunked_data[pos][::-1]
-        return b"".join(chunked_data)
+            if 0 <= pos < total_chunks:
+                lo = pos * chunk_size
+                buf[lo:lo + chunk_size] = buf[lo:lo + chunk_size][::-1]
+        return buf
     except Exception as e:
         print(f"Error in reverse_chunks_in_memory: {e}")
         return None
 
-def compress_with_paq(data, compressed_filename, positions, original_size):
-    """Compresses data using paq, adds metadata, and saves it."""
+def compress_with_paq(data, positions, original_size):
+    """Compresses data using paq with metadata."""
     try:
         chunk_size = 1  # Chunk size is always 1
-        metadata = struct.pack(">Q", original_size)
-        metadata += struct.pack(">I", chunk_size)
-        metadata += struct.pack(">I", len(positions))
-        metadata += struct.pack(f">{len(positions)}I", *positions)
-        compressed_data = paq.compress(metadata + data)
-        with open(compressed_filename, 'wb') as outfile:
-            outfile.write(compressed_data)
-        return True
+        metadata = bytearray(_HDR.size + 4 * len(positions))
+        _HDR.pack_into(metadata, 0, original_size, chunk_size, len(positions))
+        packed_positions = array('I', positions)
+        if sys.byteorder == 'little':
+            packed_positions.byteswap()  # Positions are stored big-endian
+        metadata[_HDR.size:] = packed_positions
+        return paq.compress(b"".join((metadata, data)))
     except Exception as e:
         print(f"Error in compress_with_paq: {e}")
-        return False
+        return None
+
+def write_bytes(path, blob):
+    """Writes blob to path, replacing any previous content."""
+    with open(path, 'wb') as outfile:
+        outfile.write(blob)
 
 def decompress_and_restore_paq(compressed_filename):
     """Decompresses and restores data from a paq-compressed file."""
@@ -45,17 +56,12 @@ def decompress_and_restore_paq(compressed_filename):
         with open(compressed_filename, 'rb') as infile:
             compressed_data = infile.read()
         decompressed_data = paq.decompress(compressed_data)
-        original_size = struct.unpack(">Q", decompressed_data[:8])[0]
-        chunk_size = struct.unpack(">I", decompressed_data[8:12])[0]
-        num_positions = struct.unpack(">I", decompressed_data[12:16])[0]
-        positions = list(struct.unpack(f">{num_positions}I", decompressed_data[16:16 + num_positions * 4]))
-        chunked_data = decompressed_data[16 + num_positions * 4:]
-        total_chunks = len(chunked_data) // chunk_size
-        chunked_data = [chunked_data[i * chunk_size:(i + 1) * chunk_size] for i in range(total_chunks)]
-        for pos in positions:
-            if 0 <= pos < len(chunked_data):
-                chunked_data[pos] = chunked_data[pos][::-1]
-        restored_data = b"".join(chunked_data)[:original_size]
+        original_size, chunk_size, num_positions = _HDR.unpack_from(decompressed_data)
+        positions = array('I', decompressed_data[_HDR.size:_HDR.size + num_positions * 4])
+        if sys.byteorder == 'little':
+            positions.byteswap()
+        chunked_data = memoryview(decompressed_data)[_HDR.size + num_positions * 4:]  # Copied once, by the reversal
+        restored_data = reverse_chunks_in_memory(chunked_data, chunk_size, positions)[:original_size]
         restored_filename = compressed_filename.replace('.compressed.bin', '')
         with open(restored_filename, 'wb') as outfile:
             outfile.write(restored_data)
@@ -65,33 +71,21 @@ def decompress_and_restore_paq(compressed_filename):
         print(f"Error in decompress_and_restore_paq: {e}")
         return False
 
-def find_best_chunk_strategy(input_filename, timeout_seconds=60):
-    """Finds the best positions for compression within a time limit (chunk size is fixed to 1)."""
+def find_best_chunk_strategy(input_filename):
+    """Compresses the input with the chunk size fixed to 1, where no position choice changes the data."""
     try:
         with open(input_filename, 'rb') as infile:
             original_data = infile.read()
         file_size = len(original_data)
-        best_positions = []
-        best_compression_ratio = float('inf')
         base_name, _ = os.path.splitext(input_filename)
         compressed_filename = base_name + ".compressed.bin"
-        chunk_size = 1  # Chunk size is always 1
-        start_time = time.time()
-        while time.time() - start_time < timeout_seconds:
-            max_positions = file_size // chunk_size
-            if max_positions > 0:
-                positions_count = min(max_positions, 64)
-                #More efficient position calculation
-                positions = sorted(random.sample(range(max_positions), positions_count))
-                reversed_data = reverse_chunks_in_memory(original_data, chunk_size, positions)
-                if reversed_data and compress_with_paq(reversed_data, compressed_filename, positions, file_size):
-                    compressed_size = os.path.getsize(compressed_filename)
-                    compression_ratio = compressed_size / file_size
-                    if compression_ratio < best_compression_ratio:
-                        best_compression_ratio = compression_ratio
-                        best_positions = positions
-                        print(f"Improved compression: ratio={best_compression_ratio:.4f}")
-        print(f"\nBest compression found: ratio={best_compression_ratio:.4f}")
+        # Reversing one-byte chunks changes nothing, so every trial would compress the same bytes
+        # and differ only in the stored positions; no positions gives the smallest header
+        compressed_data = compress_with_paq(original_data, [], file_size)
+        if not compressed_data:
+            return False
+        write_bytes(compressed_filename, compressed_data)
+        print(f"\nBest compression found: ratio={len(compressed_data) / file_size:.4f} (chunk size 1, no search needed)")
         return True
     except Exception as e:
         print(f"Error in find_best_chunk_strategy: {e}")
@@ -1,8 +1,17 @@
+import hashlib
 import os
 import random
 import struct
 import paq
 import time
+from concurrent.futures import ProcessPoolExecutor
+
+SEARCH_WORKERS = os.cpu_count() or 1  # Processes running search trials in parallel (paq holds the GIL)
+
+_HDR = struct.Struct(">QIII")  # Original size, chunk size, number of reversals and number of sets
+_compressed_sizes = {}  # blake2b digest of a paq input -> its compressed size
+_search_data = None  # Input bytes held by each search worker process
+_LEADING_ZEROS = bytes(8 - value.bit_length() for value in range(256))  # Leading zero bits of each byte value
 
 def apply_minus_operation(value):
     """Applies a modified minus operation."""
@@ -22,12 +31,9 @@ def manage_leading_zeros(input_data):
     if not stripped_data:
         stripped_data = b'\x00'
 
-    leading_zeros = 0
-    for byte in stripped_data:
-        if byte == 0:
-            leading_zeros += 8
-        else:
-            leading_zeros += (8 - len(bin(byte)) + bin(byte).index('1') - 2) if byte != 0 else 0
+    # Map every byte to its leading zero bits in one pass, then total each of the eight nonzero counts
+    zero_bits = stripped_data.translate(_LEADING_ZEROS)
+    leading_zeros = sum(bits * zero_bits.count(bits) for bits in range(1, 9))
 
     print(f"Leading zeros count: {leading_zeros} bits")  # Debug output
 
@@ -39,41 +45,55 @@ def manage_leading_zeros(input_data):
 def reverse_chunks_in_memory(data, chunk_size, num_reversals, num_sets):
     """Reverses chunks of data in memory."""
     try:
-        chunked_data = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
-        if len(chunked_data[-1]) < chunk_size:
-            chunked_data[-1] += b'\x00' * (chunk_size - len(chunked_data[-1]))
-
-        total_chunks = len(chunked_data)
+        if chunk_size == 1:
+            return data  # One-byte chunks are their own reverse, whatever positions are drawn
+
+        # Copy once into a padded buffer and reverse the selected chunks in place
+        buf = bytearray(data)
+        if len(buf) % chunk_size:
+            buf.extend(b'\x00' * (chunk_size - len(buf) % chunk_size))
+
+        # A chunk drawn in an even number of rounds ends up unchanged, so only the parity of
+        # each chunk's draws is kept and the odd ones are reversed once
+        total_chunks = len(buf) // chunk_size
+        flips = set()
         for _ in range(num_reversals):
             if total_chunks > 1:
-                positions = random.sample(range(total_chunks), min(num_sets, total_chunks))
-                for pos in positions:
-                    chunked_data[pos] = chunked_data[pos][::-1]
+                flips.symmetric_difference_update(random.sample(range(total_chunks), min(num_sets, total_chunks)))
+        for pos in flips:
+            lo = pos * chunk_size
+            buf[lo:lo + chunk_size] = buf[lo:lo + chunk_size][::-1]
 
-        return b"".join(chunked_data)
+        return buf
     except Exception as e:
         print(f"Error in reverse_chunks_in_memory: {e}")
         return None
 
-def compress_with_paq(data, compressed_filename, num_reversals, num_sets, original_size):
-    """Compresses data using paq, adds metadata, and saves it."""
+def compress_with_paq(data, num_reversals, num_sets, original_size):
+    """Compresses data using paq with metadata. Returns None for an input that was already compressed."""
     try:
         chunk_size = 1
-        metadata = struct.pack(">Q", original_size)
-        metadata += struct.pack(">I", chunk_size)
-        metadata += struct.pack(">I", num_reversals)
-        metadata += struct.pack(">I", num_sets)
+        metadata = _HDR.pack(original_size, chunk_size, num_reversals, num_sets)
 
         modified_metadata_len = apply_minus_operation(len(metadata))
         metadata = metadata[:modified_metadata_len]
 
-        compressed_data = paq.compress(metadata + data)
-        with open(compressed_filename, 'wb') as outfile:
-            outfile.write(compressed_data)
-        return True
+        payload = metadata + data
+        # paq is deterministic, so a repeated input cannot beat the size it got the first time
+        key = hashlib.blake2b(payload, digest_size=16).digest()
+        if key in _compressed_sizes:
+            return None
+        compressed_data = paq.compress(payload)
+        _compressed_sizes[key] = len(compressed_data)
+        return compressed_data
     except Exception as e:
         print(f"Error in compress_with_paq: {e}")
-        return False
+        return None
+
+def write_bytes(path, blob):
+    """Writes blob to path, replacing any previous content."""
+    with open(path, 'wb') as outfile:
+        outfile.write(blob)
 
 def decompress_and_restore_paq(compressed_filename):
     """Decompresses and restores data from a paq-compressed file."""
@@ -87,12 +107,10 @@ def decompress_and_restore_paq(compressed_filename):
             compressed_data = infile.read()
         decompressed_data = paq.decompress(compressed_data)
 
-        original_size = struct.unpack(">Q", decompressed_data[:8])[0]
-        chunk_size = struct.unpack(">I", decompressed_data[8:12])[0]
-        num_reversals = struct.unpack(">I", decompressed_data[12:16])[0]
-        num_sets = struct.unpack(">I", decompressed_data[16:20])[0]
+        original_size, chunk_size, num_reversals, num_sets = _HDR.unpack_from(decompressed_data)
 
-        restored_data = reverse_chunks_in_memory(decompressed_data[20:], chunk_size, num_reversals, num_sets)
+        # A view of the data after the header; the reversal makes the only copy
+        restored_data = reverse_chunks_in_memory(memoryview(decompressed_data)[_HDR.size:], chunk_size, num_reversals, num_sets)
         restored_data = restored_data[:original_size]
         restored_filename = compressed_filename.replace('.compressed.bin', '')
         with open(restored_filename, 'wb') as outfile:
@@ -103,6 +121,19 @@ def decompress_and_restore_paq(compressed_filename):
         print(f"Error in decompress_and_restore_paq: {e}")
         return False
 
+def init_search_worker(data):
+    """Stores the input once per search worker process."""
+    global _search_data
+    _search_data = data
+
+def compress_candidate(candidate):
+    """Reverses and compresses the worker's input for one (iteration, num_reversals, num_sets) trial."""
+    _, num_reversals, num_sets = candidate
+    reversed_data = reverse_chunks_in_memory(_search_data, 1, num_reversals, num_sets)
+    if not reversed_data:
+        return None
+    return compress_with_paq(reversed_data, num_reversals, num_sets, len(_search_data))
+
 def find_best_chunk_strategy(input_filename, iterations=10000):
     """Finds the best compression strategy within a specified number of iterations."""
     try:
@@ -115,20 +146,32 @@ def find_best_chunk_strategy(input_filename, iterations=10000):
         base_name, _ = os.path.splitext(input_filename)
         compressed_filename = base_name + ".compressed.bin"
         chunk_size = 1
-
-        for iteration in range(1, iterations + 1):
-            num_reversals = random.randint(1, 64)
-            num_sets = random.randint(1, min(file_size, 64))
-            reversed_data = reverse_chunks_in_memory(original_data, chunk_size, num_reversals, num_sets)
-
-            if reversed_data and compress_with_paq(reversed_data, compressed_filename, num_reversals, num_sets, file_size):
-                compressed_size = os.path.getsize(compressed_filename)
-                compression_ratio = compressed_size / file_size
-                if compression_ratio < best_compression_ratio:
-                    best_compression_ratio = compression_ratio
-                    best_num_reversals = num_reversals
-                    best_num_sets = num_sets
-                    print(f"Iteration {iteration}: Improved compression: ratio={best_compression_ratio:.4f}, reversals={best_num_reversals}, sets={best_num_sets}")
+        seen = set()  # (num_reversals, num_sets) pairs already drawn
+
+        # Draw every iteration's pair up front, two sampling calls per run instead of two per iteration
+        reversal_draws = random.choices(range(1, 65), k=iterations)
+        set_draws = random.choices(range(1, min(file_size, 64) + 1), k=iterations)
+
+        candidates = []
+        for iteration, num_reversals, num_sets in zip(range(1, iterations + 1), reversal_draws, set_draws):
+            if chunk_size == 1:
+                # One-byte chunks reverse to themselves, so a repeated pair would compress identical input
+                if (num_reversals, num_sets) in seen:
+                    continue
+                seen.add((num_reversals, num_sets))
+            candidates.append((iteration, num_reversals, num_sets))
+
+        # Trials are drawn here and compressed by worker processes that each hold a copy of the input
+        with ProcessPoolExecutor(max_workers=SEARCH_WORKERS, initializer=init_search_worker, initargs=(original_data,)) as executor:
+            for (iteration, num_reversals, num_sets), compressed_data in zip(candidates, executor.map(compress_candidate, candidates)):
+                if compressed_data:
+                    compression_ratio = len(compressed_data) / file_size
+                    if compression_ratio < best_compression_ratio:
+                        write_bytes(compressed_filename, compressed_data)
+                        best_compression_ratio = compression_ratio
+                        best_num_reversals = num_reversals
+                        best_num_sets = num_sets
+                        print(f"Iteration {iteration}: Improved compression: ratio={best_compression_ratio:.4f}, reversals={best_num_reversals}, sets={best_num_sets}")
 
         print(f"\nBest compression found: ratio={best_compression_ratio:.4f}, reversals={best_num_reversals}, sets={best_num_sets}")
         return True
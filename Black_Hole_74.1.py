@@ -1,43 +1,62 @@
+import argparse
+import mmap
 import os
 import random
 import struct
+import sys
 import time
 import paq
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-def manage_leading_zeros(input_data):
-    """Strips leading zeros from byte data."""
-    if not isinstance(input_data, bytes):
-        raise ValueError("Input data must be bytes.")
-    stripped_data = input_data.lstrip(b'\x00')
-    return stripped_data or b'\x00'
+SEARCH_WORKERS = os.cpu_count() or 1  # Threads or processes running search trials in parallel
+PROBE_SIZE = 1 << 20  # Leading bytes of a trial's data compressed first, as a cheap estimate of its full size
+PROBE_TOLERANCE = 1.05  # Trials whose probe exceeds the worker's best probe by more than this factor skip the full run
+
+_GIL_PROBE = bytes(range(256)) * 256  # Compressed once alone and twice on threads to time paq
+_search_executor_class = None  # Pool type for the search trials, chosen by search_executor_class
+_HDR = struct.Struct(">IIB")  # Original size, chunk size and number of positions
+_metadata_structs = {}  # Number of positions -> struct.Struct packing the metadata
+_search_data = None  # Input bytes held by the search workers
+_best_probe_size = None  # Smallest paq size of a probe among the trials this search worker compressed in full
+_search_deadline = None  # time.time() after which search workers skip their trials
 
 def reverse_chunks_at_positions(input_data, chunk_size, positions):
     """Reverses specified chunks of byte data."""
-    chunked_data = [input_data[i:i + chunk_size] for i in range(0, len(input_data), chunk_size)]
-    
-    # Handle padding
-    padding_needed = (chunk_size - len(chunked_data[-1]) % chunk_size) % chunk_size
-    chunked_data[-1] += b'\x00' * padding_needed
+    # Copy once into a buffer and handle padding
+    buf = bytearray(input_data)
+    buf.extend(b'\x00' * (-len(buf) % chunk_size))
     
+    # Reverse the selected chunks in place
+    num_chunks = len(buf) // chunk_size
     for pos in positions:
-        if 0 <= pos < len(chunked_data):
-            chunked_data[pos] = chunked_data[pos][::-1]
+        if 0 <= pos < num_chunks:
+            lo = pos * chunk_size
+            buf[lo:lo + chunk_size] = buf[lo:lo + chunk_size][::-1]
     
-    return b"".join(chunked_data)
+    return buf
 
 def add_random_bytes(data, num_bytes=4):
     """Adds random 4-byte sequences at random positions."""
     num_insertions = max(1, len(data) // 100)  # Ensure at least one insertion if the data is large enough
-    for _ in range(num_insertions):  
-        pos = random.randint(0, max(0, len(data) - num_bytes))
-        data = data[:pos] + os.urandom(num_bytes) + data[pos + num_bytes:]
-    return data
+    # Overwrite in one copy of the buffer instead of rebuilding it on every insertion
+    buf = bytearray(data)
+    noise = os.urandom(num_insertions * num_bytes)  # One system call for all the random bytes
+    for i in range(0, len(noise), num_bytes):
+        pos = random.randint(0, max(0, len(buf) - num_bytes))
+        buf[pos:pos + num_bytes] = noise[i:i + num_bytes]
+    return buf
+
+def metadata_struct(num_positions):
+    """Returns the cached struct.Struct that packs the metadata for num_positions positions."""
+    fmt = _metadata_structs.get(num_positions)
+    if fmt is None:
+        fmt = _metadata_structs[num_positions] = struct.Struct(f">IIB{num_positions}I")
+    return fmt
 
 def compress_with_paq(data, chunk_size, positions, original_size):
     """Compresses data using PAQ and embeds metadata."""
-    metadata = struct.pack(">I", original_size) + struct.pack(">I", chunk_size) + \
-               struct.pack(">B", len(positions)) + struct.pack(f">{len(positions)}I", *positions)
-    
+    metadata = metadata_struct(len(positions)).pack(original_size, chunk_size, len(positions), *positions)
+
     compressed_data = paq.compress(metadata + data)
     return compressed_data
 
@@ -49,12 +68,11 @@ def decompress_and_restore_paq(compressed_filename):
         
         decompressed_data = paq.decompress(compressed_data)
         
-        original_size = struct.unpack(">I", decompressed_data[:4])[0]
-        chunk_size = struct.unpack(">I", decompressed_data[4:8])[0]
-        num_positions = struct.unpack(">B", decompressed_data[8:9])[0]
-        positions = struct.unpack(f">{num_positions}I", decompressed_data[9:9 + num_positions * 4])
+        original_size, chunk_size, num_positions = _HDR.unpack_from(decompressed_data)
+        metadata = metadata_struct(num_positions)
+        positions = metadata.unpack_from(decompressed_data)[3:]
         
-        restored_data = reverse_chunks_at_positions(decompressed_data[9 + num_positions * 4:], chunk_size, positions)
+        restored_data = reverse_chunks_at_positions(memoryview(decompressed_data)[metadata.size:], chunk_size, positions)
         restored_data = restored_data[:original_size]
         
         restored_filename = compressed_filename.replace('.compressed.bin', '')
@@ -66,12 +84,70 @@ def decompress_and_restore_paq(compressed_filename):
     except (FileNotFoundError, paq.PAQError, struct.error) as e:
         print(f"Decompression failed: {e}")
 
+def passes_probe(data):
+    """Compresses the first PROBE_SIZE bytes of data and reports whether the trial is worth a full compression."""
+    global _best_probe_size
+    if len(data) <= PROBE_SIZE:
+        return True  # The probe would cost as much as the full compression
+    probe_size = len(paq.compress(bytes(memoryview(data)[:PROBE_SIZE])))
+    if probe_size > _best_probe_size * PROBE_TOLERANCE:
+        return False
+    _best_probe_size = min(_best_probe_size, probe_size)
+    return True
+
+def search_executor_class():
+    """Returns ThreadPoolExecutor if paq.compress runs in parallel on threads, else ProcessPoolExecutor."""
+    global _search_executor_class
+    if _search_executor_class is None:
+        # Threads share the input and skip pickling, but only help if paq releases the GIL:
+        # then two concurrent compressions take about as long as one
+        start = time.perf_counter()
+        paq.compress(_GIL_PROBE)
+        single = time.perf_counter() - start
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            start = time.perf_counter()
+            list(executor.map(paq.compress, [_GIL_PROBE] * 2))
+            pair = time.perf_counter() - start
+        _search_executor_class = ThreadPoolExecutor if pair < 1.5 * single else ProcessPoolExecutor
+    return _search_executor_class
+
+def map_input(input_filename):
+    """Maps the input file read-only, so the parent and every search worker share its pages instead of each holding a copy."""
+    with open(input_filename, 'rb') as infile:
+        return mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+def init_search_worker(input_filename, deadline):
+    """Maps the input and stores the deadline once per search worker and gives it its own random stream."""
+    global _search_data, _search_deadline, _best_probe_size
+    _search_data = map_input(input_filename)
+    _search_deadline = deadline
+    _best_probe_size = float('inf')
+    random.seed()  # Forked workers would otherwise all draw the parent's sequence
+
+def run_trial(_):
+    """Runs one random trial; returns its chunk size, positions and compressed size, or None past the deadline."""
+    if time.time() >= _search_deadline:
+        return None
+    file_size = len(_search_data)
+    chunk_size = random.randint(1, min(256, file_size))  # Cap chunk size to file size
+    max_positions = file_size // chunk_size
+    num_positions = random.randint(0, min(max_positions, 64))  # Limit number of positions
+    positions = sorted(random.sample(range(max_positions), num_positions)) if num_positions > 0 else []
+
+    # Reverse chunks
+    reversed_data = reverse_chunks_at_positions(_search_data, chunk_size, positions)
+
+    # Add random 4-byte data
+    modified_data = add_random_bytes(reversed_data)
+    if not passes_probe(modified_data):
+        return chunk_size, positions, float('inf')
+    compressed_data = compress_with_paq(modified_data, chunk_size, positions, file_size)
+    return chunk_size, positions, len(compressed_data)
+
 def find_best_chunk_strategy(input_filename, max_time_seconds):
     """Finds the best chunk size and reversal positions for compression."""
     try:
-        with open(input_filename, 'rb') as infile:
-            file_data = infile.read()
-        
+        file_data = map_input(input_filename)
         file_size = len(file_data)
     except FileNotFoundError:
         print(f"Error: Input file '{input_filename}' not found.")
@@ -84,28 +160,23 @@ def find_best_chunk_strategy(input_filename, max_time_seconds):
     start_time = time.time()
     iteration = 0
     
-    while time.time() - start_time < max_time_seconds:
-        iteration += 1
-        chunk_size = random.randint(1, min(256, file_size))  # Cap chunk size to file size
-        max_positions = file_size // chunk_size
-        num_positions = random.randint(0, min(max_positions, 64))  # Limit number of positions
-        positions = sorted(random.sample(range(max_positions), num_positions)) if num_positions > 0 else []
-
-        # Reverse chunks
-        reversed_data = reverse_chunks_at_positions(file_data, chunk_size, positions)
-
-        # Add random 4-byte data
-        modified_data = add_random_bytes(reversed_data)
-
-        compressed_data = compress_with_paq(modified_data, chunk_size, positions, file_size)
-        compression_ratio = len(compressed_data) / file_size
-
-        if compression_ratio < best_compression_ratio:
-            best_compression_ratio = compression_ratio
-            best_chunk_size = chunk_size
-            best_positions = positions
-            # Print improvement ratio and size after PAQ compression
-            print(f"Improved compression: {len(compressed_data)} bytes (compression ratio: {compression_ratio:.4f})")
+    # Independent trials run a round at a time on worker threads or processes that map the input
+    deadline = start_time + max_time_seconds
+    with search_executor_class()(max_workers=SEARCH_WORKERS, initializer=init_search_worker, initargs=(input_filename, deadline)) as executor:
+        while time.time() < deadline:
+            for result in executor.map(run_trial, range(SEARCH_WORKERS)):
+                if result is None:
+                    continue  # Skipped by a worker that reached the deadline
+                iteration += 1
+                chunk_size, positions, compressed_size = result
+                compression_ratio = compressed_size / file_size
+
+                if compression_ratio < best_compression_ratio:
+                    best_compression_ratio = compression_ratio
+                    best_chunk_size = chunk_size
+                    best_positions = positions
+                    # Print improvement ratio and size after PAQ compression
+                    print(f"Improved compression: {compressed_size} bytes (compression ratio: {compression_ratio:.4f})")
 
     elapsed_time = time.time() - start_time
     print(f"\nBest compression achieved after {iteration} iterations (time limit: {max_time_seconds} seconds):")
@@ -122,10 +193,32 @@ def find_best_chunk_strategy(input_filename, max_time_seconds):
         print(f"Compressed file saved as {compressed_filename}")
     except Exception as e:
         print(f"Error writing compressed file: {e}")
+    file_data.close()
+
+def parse_args():
+    """Parses the command line for batch runs; returns None when no arguments were given, to keep the prompts."""
+    if len(sys.argv) == 1:
+        return None
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["compress", "extract"], required=True)
+    parser.add_argument("--input", required=True, help="file to compress, or the .compressed.bin file to extract")
+    parser.add_argument("--max-time", type=int, default=3600, help="search time limit in seconds")
+    parser.add_argument("--jobs", type=int, default=SEARCH_WORKERS, help="search workers to run in parallel")
+    return parser.parse_args()
 
 def main():
+    global SEARCH_WORKERS
     print("Created by Jurijus Pacalovas.")
 
+    args = parse_args()
+    if args is not None:
+        SEARCH_WORKERS = args.jobs
+        if args.mode == "compress":
+            find_best_chunk_strategy(args.input, args.max_time)
+        else:
+            decompress_and_restore_paq(args.input)
+        return
+
     while True:
         try:
             mode = int(input("Enter mode (1 for compress, 2 for extract): "))
@@ -1,31 +1,58 @@
+import argparse
+import hashlib
+import mmap
 import os
 import random
 import struct
+import sys
 import time
 import paq
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-def manage_leading_zeros(input_data):
-    """Strips leading zeros from byte data."""
-    if not isinstance(input_data, bytes):
-        raise ValueError("Input data must be bytes.")
-    stripped_data = input_data.lstrip(b'\x00')
-    return stripped_data or b'\x00'
+SEARCH_WORKERS = os.cpu_count() or 1  # Threads or processes running search trials in parallel
+PROBE_SIZE = 1 << 20  # Leading bytes of a trial's data compressed first, as a cheap estimate of its full size
+PROBE_TOLERANCE = 1.05  # Trials whose probe exceeds the worker's best probe by more than this factor skip the full run
+
+_GIL_PROBE = bytes(range(256)) * 256  # Compressed once alone and twice on threads to time paq
+_search_executor_class = None  # Pool type for the search trials, chosen by search_executor_class
+_HDR = struct.Struct(">IIB")  # Original size, chunk size and number of positions
+_metadata_structs = {}  # Number of positions -> struct.Struct packing the metadata
+_last_metadata = (None, b"")  # (original_size, chunk_size, positions) and its packed metadata, strategy byte excluded
+_search_data = None  # Input bytes held by the search workers
+_best_probe_size = None  # Smallest paq size of a probe among the trials this search worker compressed in full
+_search_deadline = None  # time.time() after which search workers skip their trials
+_tried_layouts = set()  # blake2b digests of the (chunk_size, positions) layouts already compressed with strategy 1
 
 def reverse_chunks_at_positions(input_data, chunk_size, positions):
     """Reverses specified chunks of byte data."""
-    chunked_data = [input_data[i:i + chunk_size] for i in range(0, len(input_data), chunk_size)]
-    padding_needed = (chunk_size - len(chunked_data[-1]) % chunk_size) % chunk_size
-    chunked_data[-1] += b'\x00' * padding_needed
+    # Copy once into a buffer padded to whole chunks and reverse the selected chunks in place
+    buf = bytearray(input_data)
+    buf.extend(b'\x00' * (-len(buf) % chunk_size))
+    num_chunks = len(buf) // chunk_size
     for pos in positions:
-        if 0 <= pos < len(chunked_data):
-            chunked_data[pos] = chunked_data[pos][::-1]
-    return b"".join(chunked_data)
+        if 0 <= pos < num_chunks:
+            lo = pos * chunk_size
+            buf[lo:lo + chunk_size] = buf[lo:lo + chunk_size][::-1]
+    return buf
+
+def metadata_struct(num_positions):
+    """Returns the cached struct.Struct that packs the metadata, up to the strategy byte, for num_positions positions."""
+    fmt = _metadata_structs.get(num_positions)
+    if fmt is None:
+        fmt = _metadata_structs[num_positions] = struct.Struct(f">IIB{num_positions}I")
+    return fmt
 
 def compress_with_paq(data, chunk_size, positions, original_size, strategy):
     """Compresses data using PAQ and embeds metadata, including the strategy."""
-    metadata = struct.pack(">I", original_size) + struct.pack(">I", chunk_size) + \
-               struct.pack(">B", len(positions)) + struct.pack(f">{len(positions)}I", *positions) + \
-               struct.pack(">B", strategy)  # Add strategy bit to metadata
+    global _last_metadata
+    # Both strategies of a trial share the layout, so the second call reuses the packed prefix
+    key = (original_size, chunk_size, tuple(positions))
+    cached_key, layout_metadata = _last_metadata
+    if cached_key != key:
+        layout_metadata = metadata_struct(len(positions)).pack(original_size, chunk_size, len(positions), *positions)
+        _last_metadata = (key, layout_metadata)
+    metadata = layout_metadata + struct.pack(">B", strategy)
     compressed_data = paq.compress(metadata + data)
     return compressed_data
 
@@ -35,12 +62,11 @@ def decompress_and_restore_paq(compressed_filename):
         with open(compressed_filename, 'rb') as infile:
             compressed_data = infile.read()
         decompressed_data = paq.decompress(compressed_data)
-        original_size = struct.unpack(">I", decompressed_data[:4])[0]
-        chunk_size = struct.unpack(">I", decompressed_data[4:8])[0]
-        num_positions = struct.unpack(">B", decompressed_data[8:9])[0]
-        positions = struct.unpack(f">{num_positions}I", decompressed_data[9:9 + num_positions * 4])
-        strategy = struct.unpack(">B", decompressed_data[9 + num_positions * 4: 9 + num_positions * 4 + 1])[0]  # Extract strategy bit
-        restored_data = reverse_chunks_at_positions(decompressed_data[9 + num_positions * 4 + 1:], chunk_size, positions)
+        original_size, chunk_size, num_positions = _HDR.unpack_from(decompressed_data)
+        metadata = metadata_struct(num_positions)
+        positions = metadata.unpack_from(decompressed_data)[3:]
+        strategy = decompressed_data[metadata.size]  # Extract strategy bit
+        restored_data = reverse_chunks_at_positions(memoryview(decompressed_data)[metadata.size + 1:], chunk_size, positions)
         restored_data = restored_data[:original_size]
         restored_filename = compressed_filename.replace('.compressed.bin', '')
         with open(restored_filename, 'wb') as outfile:
@@ -55,17 +81,96 @@ def decompress_and_restore_paq(compressed_filename):
 def add_random_bytes(data, num_bytes=4):
     """Adds random 4-byte sequences at random positions."""
     num_insertions = max(1, len(data) // 100)
-    for _ in range(num_insertions):
-        pos = random.randint(0, max(0, len(data) - num_bytes))
-        data = data[:pos] + os.urandom(num_bytes) + data[pos:]
-    return data
+    # Draw the insertion points up front and build the result in one pass, instead of
+    # copying the whole buffer on every insertion
+    points = sorted(random.randint(0, max(0, len(data) - num_bytes)) for _ in range(num_insertions))
+    view = memoryview(data)
+    buf = bytearray(len(data) + num_insertions * num_bytes)
+    noise = os.urandom(num_insertions * num_bytes)  # One system call for all the random bytes
+    src = dst = 0
+    for i, pos in enumerate(points):
+        buf[dst:dst + pos - src] = view[src:pos]
+        dst += pos - src
+        buf[dst:dst + num_bytes] = noise[i * num_bytes:(i + 1) * num_bytes]
+        dst += num_bytes
+        src = pos
+    buf[dst:] = view[src:]
+    return buf
+
+def passes_probe(data):
+    """Compresses the first PROBE_SIZE bytes of data and reports whether the trial is worth a full compression."""
+    global _best_probe_size
+    if len(data) <= PROBE_SIZE:
+        return True  # The probe would cost as much as the full compression
+    probe_size = len(paq.compress(bytes(memoryview(data)[:PROBE_SIZE])))
+    if probe_size > _best_probe_size * PROBE_TOLERANCE:
+        return False
+    _best_probe_size = min(_best_probe_size, probe_size)
+    return True
+
+def search_executor_class():
+    """Returns ThreadPoolExecutor if paq.compress runs in parallel on threads, else ProcessPoolExecutor."""
+    global _search_executor_class
+    if _search_executor_class is None:
+        # Threads share the input and skip pickling, but only help if paq releases the GIL:
+        # then two concurrent compressions take about as long as one
+        start = time.perf_counter()
+        paq.compress(_GIL_PROBE)
+        single = time.perf_counter() - start
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            start = time.perf_counter()
+            list(executor.map(paq.compress, [_GIL_PROBE] * 2))
+            pair = time.perf_counter() - start
+        _search_executor_class = ThreadPoolExecutor if pair < 1.5 * single else ProcessPoolExecutor
+    return _search_executor_class
+
+def map_input(input_filename):
+    """Maps the input file read-only, so the parent and every search worker share its pages instead of each holding a copy."""
+    with open(input_filename, 'rb') as infile:
+        return mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+def init_search_worker(input_filename, deadline):
+    """Maps the input and stores the deadline once per search worker and gives it its own random stream."""
+    global _search_data, _search_deadline, _best_probe_size
+    _search_data = map_input(input_filename)
+    _search_deadline = deadline
+    _best_probe_size = float('inf')
+    random.seed()  # Forked workers would otherwise all draw the parent's sequence
+
+def run_trial(_):
+    """Runs one random trial with both strategies; returns the compressed sizes, or None past the deadline."""
+    if time.time() >= _search_deadline:
+        return None
+    file_size = len(_search_data)
+    chunk_size = random.randint(1, min(256, file_size))
+    max_positions = file_size // chunk_size
+    num_positions = random.randint(0, min(max_positions, 64))
+    positions = sorted(random.sample(range(max_positions), num_positions)) if num_positions > 0 else []
+
+    # Both strategies start from the same reversal
+    reversed_data = reverse_chunks_at_positions(_search_data, chunk_size, positions)
+    if not passes_probe(reversed_data):
+        return chunk_size, positions, float('inf'), float('inf')  # Neither strategy is compressed in full
+
+    # Strategy 1: Basic reversal. Its input depends only on the layout, so a repeat would reproduce
+    # a size this worker already returned, which cannot beat the best found since
+    layout = hashlib.blake2b(array('I', [chunk_size, *positions]), digest_size=16).digest()  # 16 bytes instead of a tuple of up to 65 ints
+    if layout in _tried_layouts:
+        compressed_size_1 = float('inf')
+    else:
+        _tried_layouts.add(layout)
+        compressed_size_1 = len(compress_with_paq(reversed_data, chunk_size, positions, file_size, 0))  # strategy 0
+
+    # Strategy 2: Reversal + random bytes
+    modified_data_2 = add_random_bytes(reversed_data)  # Builds a new buffer; reversed_data is unchanged
+    compressed_data_2 = compress_with_paq(modified_data_2, chunk_size, positions, file_size, 1)  # strategy 1
+    return chunk_size, positions, compressed_size_1, len(compressed_data_2)
 
 def find_best_chunk_strategy(input_filename, max_time_seconds):
     """Finds the best chunk size and reversal positions for compression, automatically choosing the best strategy."""
     try:
-        with open(input_filename, 'rb') as infile:
-            file_data = infile.read()
-            file_size = len(file_data)
+        file_data = map_input(input_filename)
+        file_size = len(file_data)
     except FileNotFoundError:
         print(f"Error: Input file '{input_filename}' not found.")
         return
@@ -77,37 +182,31 @@ def find_best_chunk_strategy(input_filename, max_time_seconds):
     start_time = time.time()
 
     iteration = 0
-    while time.time() - start_time < max_time_seconds:
-        iteration += 1
-        chunk_size = random.randint(1, min(256, file_size))
-        max_positions = file_size // chunk_size
-        num_positions = random.randint(0, min(max_positions, 64))
-        positions = sorted(random.sample(range(max_positions), num_positions)) if num_positions > 0 else []
-
-        # Strategy 1: Basic reversal
-        reversed_data_1 = reverse_chunks_at_positions(file_data, chunk_size, positions)
-        compressed_data_1 = compress_with_paq(reversed_data_1, chunk_size, positions, file_size, 0)  # strategy 0
-        compression_ratio_1 = len(compressed_data_1) / file_size
-
-        # Strategy 2: Reversal + random bytes
-        reversed_data_2 = reverse_chunks_at_positions(file_data, chunk_size, positions)
-        modified_data_2 = add_random_bytes(reversed_data_2)
-        compressed_data_2 = compress_with_paq(modified_data_2, chunk_size, positions, file_size, 1)  # strategy 1
-        compression_ratio_2 = len(compressed_data_2) / file_size
-
-        # Choose the better strategy automatically
-        if compression_ratio_1 < compression_ratio_2 and compression_ratio_1 < best_compression_ratio:
-            best_compression_ratio = compression_ratio_1
-            best_chunk_size = chunk_size
-            best_positions = positions
-            best_strategy = 0
-            print(f"Improved compression (Strategy 1): {len(compressed_data_1)} bytes (ratio: {compression_ratio_1:.4f})")
-        elif compression_ratio_2 < best_compression_ratio:
-            best_compression_ratio = compression_ratio_2
-            best_chunk_size = chunk_size
-            best_positions = positions
-            best_strategy = 1
-            print(f"Improved compression (Strategy 2): {len(compressed_data_2)} bytes (ratio: {compression_ratio_2:.4f})")
+    # Independent trials run a round at a time on worker threads or processes that map the input
+    deadline = start_time + max_time_seconds
+    with search_executor_class()(max_workers=SEARCH_WORKERS, initializer=init_search_worker, initargs=(input_filename, deadline)) as executor:
+        while time.time() < deadline:
+            for result in executor.map(run_trial, range(SEARCH_WORKERS)):
+                if result is None:
+                    continue  # Skipped by a worker that reached the deadline
+                iteration += 1
+                chunk_size, positions, compressed_size_1, compressed_size_2 = result
+                compression_ratio_1 = compressed_size_1 / file_size
+                compression_ratio_2 = compressed_size_2 / file_size
+
+                # Choose the better strategy automatically
+                if compression_ratio_1 < compression_ratio_2 and compression_ratio_1 < best_compression_ratio:
+                    best_compression_ratio = compression_ratio_1
+                    best_chunk_size = chunk_size
+                    best_positions = positions
+                    best_strategy = 0
+                    print(f"Improved compression (Strategy 1): {compressed_size_1} bytes (ratio: {compression_ratio_1:.4f})")
+                elif compression_ratio_2 < best_compression_ratio:
+                    best_compression_ratio = compression_ratio_2
+                    best_chunk_size = chunk_size
+                    best_positions = positions
+                    best_strategy = 1
+                    print(f"Improved compression (Strategy 2): {compressed_size_2} bytes (ratio: {compression_ratio_2:.4f})")
 
     print(f"\nBest compression achieved after {iteration} iterations (time limit: {max_time_seconds} seconds):")
     print(f"Strategy: {best_strategy}")
@@ -127,10 +226,32 @@ def find_best_chunk_strategy(input_filename, max_time_seconds):
         print(f"Compressed file saved as {compressed_filename}")
     except Exception as e:
         print(f"Error writing compressed file: {e}")
+    file_data.close()
+
+def parse_args():
+    """Parses the command line for batch runs; returns None when no arguments were given, to keep the prompts."""
+    if len(sys.argv) == 1:
+        return None
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["compress", "extract"], required=True)
+    parser.add_argument("--input", required=True, help="file to compress, or the .compressed.bin file to extract")
+    parser.add_argument("--max-time", type=int, default=3600, help="search time limit in seconds")
+    parser.add_argument("--jobs", type=int, default=SEARCH_WORKERS, help="search workers to run in parallel")
+    return parser.parse_args()
 
 def main():
+    global SEARCH_WORKERS
     print("Created by Jurijus Pacalovas.")
 
+    args = parse_args()
+    if args is not None:
+        SEARCH_WORKERS = args.jobs
+        if args.mode == "compress":
+            find_best_chunk_strategy(args.input, args.max_time)
+        else:
+            decompress_and_restore_paq(args.input)
+        return
+
     while True:
         try:
             mode = int(input("Enter mode (1 for compress, 2 for extract): "))
@@ -1,43 +1,97 @@
+import argparse
+import hashlib
+import mmap
 import os
 import random
 import struct
+import sys
 import time
 import paq
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+SEARCH_WORKERS = os.cpu_count() or 1  # Threads or processes running search trials in parallel
+CONVERGENCE_ATTEMPTS = 5  # Attempts over which run_compression checks the best ratio for progress
+CONVERGENCE_EPSILON = 1e-4  # Smallest gain in the best ratio over those attempts that keeps run_compression going
+PROBE_SIZE = 1 << 20  # Leading bytes of a trial's data compressed first, as a cheap estimate of its full size
+PROBE_TOLERANCE = 1.05  # Trials whose probe exceeds the worker's best probe by more than this factor skip the full run
+
+_GIL_PROBE = bytes(range(256)) * 256  # Compressed once alone and twice on threads to time paq
+_search_executor_class = None  # Pool type for the search trials, chosen by search_executor_class
+_HDR = struct.Struct(">IIB")  # Original size, chunk size and number of positions
+_metadata_structs = {}  # Number of positions -> struct.Struct packing the metadata
+_last_metadata = (None, b"")  # (original_size, chunk_size, positions) and its packed metadata, strategy byte excluded
+_search_data = None  # Input bytes held by the search workers
+_best_probe_size = None  # Smallest paq size of a probe among the trials this search worker compressed in full
+_tried_layouts = set()  # blake2b digests of the (chunk_size, positions) layouts already compressed with strategy 1
 
 def reverse_chunks_at_positions(input_data, chunk_size, positions):
     """Reverses specified chunks of byte data."""
-    chunked_data = [input_data[i:i + chunk_size] for i in range(0, len(input_data), chunk_size)]
+    # Copy once into a buffer and reverse the selected chunks in place; the last chunk may be short
+    buf = bytearray(input_data)
+    num_chunks = -(-len(buf) // chunk_size)
     for pos in positions:
-        if 0 <= pos < len(chunked_data):
-            chunked_data[pos] = chunked_data[pos][::-1]
-    return b"".join(chunked_data)
+        if 0 <= pos < num_chunks:
+            lo = pos * chunk_size
+            buf[lo:lo + chunk_size] = buf[lo:lo + chunk_size][::-1]
+    return buf
 
 def add_random_bytes(data, num_bytes=4):
     """Adds random 4-byte sequences at random positions."""
     num_insertions = max(1, len(data) // 100)
-    for _ in range(num_insertions):
-        pos = random.randint(0, max(0, len(data) - num_bytes))
-        data = data[:pos] + os.urandom(num_bytes) + data[pos:]
-    return data
+    # Draw the insertion points up front and build the result in one pass, instead of
+    # copying the whole buffer on every insertion
+    points = sorted(random.randint(0, max(0, len(data) - num_bytes)) for _ in range(num_insertions))
+    view = memoryview(data)
+    buf = bytearray(len(data) + num_insertions * num_bytes)
+    noise = os.urandom(num_insertions * num_bytes)  # One system call for all the random bytes
+    src = dst = 0
+    for i, pos in enumerate(points):
+        buf[dst:dst + pos - src] = view[src:pos]
+        dst += pos - src
+        buf[dst:dst + num_bytes] = noise[i * num_bytes:(i + 1) * num_bytes]
+        dst += num_bytes
+        src = pos
+    buf[dst:] = view[src:]
+    return buf
+
+def metadata_struct(num_positions):
+    """Returns the cached struct.Struct that packs the metadata, up to the strategy byte, for num_positions positions."""
+    fmt = _metadata_structs.get(num_positions)
+    if fmt is None:
+        fmt = _metadata_structs[num_positions] = struct.Struct(f">IIB{num_positions}I")
+    return fmt
 
 def compress_with_paq(data, chunk_size, positions, original_size, strategy):
     """Compresses data using PAQ and embeds metadata, including the strategy used."""
-    metadata = struct.pack(">I", original_size) + struct.pack(">I", chunk_size) + \
-               struct.pack(">B", len(positions)) + struct.pack(f">{len(positions)}I", *positions) + \
-               struct.pack(">B", strategy)  # Add strategy info
+    global _last_metadata
+    # Both strategies of a trial share the layout, so the second call reuses the packed prefix
+    key = (original_size, chunk_size, tuple(positions))
+    cached_key, layout_metadata = _last_metadata
+    if cached_key != key:
+        layout_metadata = metadata_struct(len(positions)).pack(original_size, chunk_size, len(positions), *positions)
+        _last_metadata = (key, layout_metadata)
+    metadata = layout_metadata + struct.pack(">B", strategy)
     return paq.compress(metadata + data)
 
+def write_bytes(path, blob):
+    """Writes blob to path, replacing the file."""
+    with open(path, 'wb') as outfile:
+        outfile.write(blob)
+
 def decompress_and_restore_paq(compressed_filename):
     """Decompresses and restores data from a compressed file."""
     try:
         with open(compressed_filename, 'rb') as infile:
             decompressed_data = paq.decompress(infile.read())
 
-        original_size, chunk_size, num_positions = struct.unpack(">IIB", decompressed_data[:9])
-        positions = struct.unpack(f">{num_positions}I", decompressed_data[9:9 + num_positions * 4])
-        strategy = struct.unpack(">B", decompressed_data[9 + num_positions * 4:10 + num_positions * 4])[0]
+        original_size, chunk_size, num_positions = _HDR.unpack_from(decompressed_data)
+        metadata = metadata_struct(num_positions)
+        positions = metadata.unpack_from(decompressed_data)[3:]
+        strategy = decompressed_data[metadata.size]
 
-        restored_data = reverse_chunks_at_positions(decompressed_data[10 + num_positions * 4:], chunk_size, positions)
+        restored_data = reverse_chunks_at_positions(memoryview(decompressed_data)[metadata.size + 1:], chunk_size, positions)
         restored_data = restored_data[:original_size]
 
         restored_filename = compressed_filename.replace('.compressed.bin', '')
@@ -48,75 +102,167 @@ def decompress_and_restore_paq(compressed_filename):
     except Exception as e:
         print(f"Error during decompression: {e}")
 
+def passes_probe(data):
+    """Compresses the first PROBE_SIZE bytes of data and reports whether the trial is worth a full compression."""
+    global _best_probe_size
+    if len(data) <= PROBE_SIZE:
+        return True  # The probe would cost as much as the full compression
+    probe_size = len(paq.compress(bytes(memoryview(data)[:PROBE_SIZE])))
+    if probe_size > _best_probe_size * PROBE_TOLERANCE:
+        return False
+    _best_probe_size = min(_best_probe_size, probe_size)
+    return True
+
+def search_executor_class():
+    """Returns ThreadPoolExecutor if paq.compress runs in parallel on threads, else ProcessPoolExecutor."""
+    global _search_executor_class
+    if _search_executor_class is None:
+        # Threads share the input and skip pickling, but only help if paq releases the GIL:
+        # then two concurrent compressions take about as long as one
+        start = time.perf_counter()
+        paq.compress(_GIL_PROBE)
+        single = time.perf_counter() - start
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            start = time.perf_counter()
+            list(executor.map(paq.compress, [_GIL_PROBE] * 2))
+            pair = time.perf_counter() - start
+        _search_executor_class = ThreadPoolExecutor if pair < 1.5 * single else ProcessPoolExecutor
+    return _search_executor_class
+
+def map_input(input_filename):
+    """Maps the input file read-only, so the search workers share its pages instead of each holding a copy."""
+    with open(input_filename, 'rb') as infile:
+        return mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+def init_search_worker(input_filename):
+    """Maps the input once per search worker and gives it its own random stream."""
+    global _search_data, _best_probe_size
+    _search_data = map_input(input_filename)
+    _best_probe_size = float('inf')
+    random.seed()  # Forked workers would otherwise all draw the parent's sequence
+
+def run_trial(_):
+    """Runs one random trial with both strategies and returns the better one's ratio, compressed data and strategy."""
+    file_size = len(_search_data)
+    chunk_size = random.randint(1, min(256, file_size))
+    num_positions = random.randint(0, min(file_size // chunk_size, 64))
+    positions = sorted(random.sample(range(file_size // chunk_size), num_positions)) if num_positions > 0 else []
+
+    # Both strategies start from the same reversal
+    reversed_data = reverse_chunks_at_positions(_search_data, chunk_size, positions)
+    if not passes_probe(reversed_data):
+        return float('inf'), None, None  # Neither strategy is compressed in full
+
+    # Strategy 1: Reverse chunks. Its input depends only on the layout, so a repeat would reproduce
+    # a result this worker already returned, which cannot beat the best found since
+    layout = hashlib.blake2b(array('I', [chunk_size, *positions]), digest_size=16).digest()  # 16 bytes instead of a tuple of up to 65 ints
+    if layout in _tried_layouts:
+        compressed_data_1, compression_ratio_1 = None, float('inf')
+    else:
+        _tried_layouts.add(layout)
+        compressed_data_1 = compress_with_paq(reversed_data, chunk_size, positions, file_size, 1)
+        compression_ratio_1 = len(compressed_data_1) / file_size
+
+    # Strategy 2: Reverse chunks + Insert random bytes
+    modified_data_2 = add_random_bytes(reversed_data)  # Builds a new buffer; reversed_data is unchanged
+    compressed_data_2 = compress_with_paq(modified_data_2, chunk_size, positions, file_size, 2)
+    compression_ratio_2 = len(compressed_data_2) / file_size
+
+    # Strategy 2 wins ties, as in the selection in find_best_iteration
+    if compression_ratio_1 < compression_ratio_2:
+        return compression_ratio_1, compressed_data_1, 1
+    return compression_ratio_2, compressed_data_2, 2
+
 def find_best_iteration(input_filename, max_iterations):
     """Finds the best compression strategy within a single attempt (7200 iterations)."""
-    with open(input_filename, 'rb') as infile:
-        file_data = infile.read()
-        file_size = len(file_data)
+    file_size = os.path.getsize(input_filename)  # The workers map the file themselves
 
     best_compression_ratio = float('inf')
     best_compressed_data = None
     best_strategy = None
 
-    for _ in range(max_iterations):
-        chunk_size = random.randint(1, min(256, file_size))
-        num_positions = random.randint(0, min(file_size // chunk_size, 64))
-        positions = sorted(random.sample(range(file_size // chunk_size), num_positions)) if num_positions > 0 else []
-
-        # Strategy 1: Reverse chunks
-        reversed_data_1 = reverse_chunks_at_positions(file_data, chunk_size, positions)
-        compressed_data_1 = compress_with_paq(reversed_data_1, chunk_size, positions, file_size, 1)
-        compression_ratio_1 = len(compressed_data_1) / file_size
-
-        # Strategy 2: Reverse chunks + Insert random bytes
-        reversed_data_2 = reverse_chunks_at_positions(file_data, chunk_size, positions)
-        modified_data_2 = add_random_bytes(reversed_data_2)
-        compressed_data_2 = compress_with_paq(modified_data_2, chunk_size, positions, file_size, 2)
-        compression_ratio_2 = len(compressed_data_2) / file_size
-
-        # Choose the best strategy in this iteration
-        if compression_ratio_1 < compression_ratio_2 and compression_ratio_1 < best_compression_ratio:
-            best_compression_ratio = compression_ratio_1
-            best_compressed_data = compressed_data_1
-            best_strategy = 1
-        elif compression_ratio_2 < best_compression_ratio:
-            best_compression_ratio = compression_ratio_2
-            best_compressed_data = compressed_data_2
-            best_strategy = 2
+    # Independent trials run on worker threads or processes that map the input
+    with search_executor_class()(max_workers=SEARCH_WORKERS, initializer=init_search_worker, initargs=(input_filename,)) as executor:
+        for compression_ratio, compressed_data, strategy in executor.map(run_trial, range(max_iterations)):
+            # Keep the best strategy across iterations
+            if compression_ratio < best_compression_ratio:
+                best_compression_ratio = compression_ratio
+                best_compressed_data = compressed_data
+                best_strategy = strategy
 
     return best_compressed_data, best_compression_ratio, best_strategy
 
-def run_compression(input_filename):
-    """Runs 30 attempts, each with 7200 iterations, and picks the best overall result."""
+def run_compression(input_filename, max_attempts=30):
+    """Runs up to max_attempts attempts, each with 7200 iterations, and picks the best overall result."""
     best_of_30_compressed_data = None
     best_of_30_ratio = float('inf')
     best_of_30_strategy = None
+    recent_best_ratios = deque(maxlen=CONVERGENCE_ATTEMPTS)
+    final_compressed_filename = f"{input_filename}.compressed.bin"
+    saver = ThreadPoolExecutor(max_workers=1)  # Writes each new best to disk while the next attempt runs
+    pending_save = None
+    attempts_run = 0  # Fewer than max_attempts when the search stops early
 
-    for i in range(30):
-        print(f"Running compression attempt {i+1}/30 with 7200 iterations...")
+    for i in range(max_attempts):
+        attempts_run = i + 1
+        print(f"Running compression attempt {i+1}/{max_attempts} with 7200 iterations...")
         compressed_data, compression_ratio, strategy = find_best_iteration(input_filename, 7200)
 
         if compressed_data and compression_ratio < best_of_30_ratio:
             best_of_30_ratio = compression_ratio
             best_of_30_compressed_data = compressed_data
             best_of_30_strategy = strategy
+            if pending_save is not None:
+                pending_save.result()  # Re-raises an error from the previous write before the next is queued
+            pending_save = saver.submit(write_bytes, final_compressed_filename, compressed_data)
 
         # Remove intermediate files
         temp_filename = f"{input_filename}_attempt_{i}.compressed.bin"
         if os.path.exists(temp_filename):
             os.remove(temp_filename)
 
-    # Save the best compression result
-    final_compressed_filename = f"{input_filename}.compressed.bin"
-    with open(final_compressed_filename, 'wb') as outfile:
-        outfile.write(best_of_30_compressed_data)
+        # Stop early once further attempts have stopped paying off
+        recent_best_ratios.append(best_of_30_ratio)
+        if len(recent_best_ratios) == CONVERGENCE_ATTEMPTS and recent_best_ratios[0] - recent_best_ratios[-1] < CONVERGENCE_EPSILON:
+            print(f"No improvement above {CONVERGENCE_EPSILON} in the last {CONVERGENCE_ATTEMPTS} attempts, stopping.")
+            break
 
-    print(f"Best of 30 compression saved as: {final_compressed_filename} (Strategy {best_of_30_strategy})")
+    # The best compression result was saved when it was found; wait for that write to land
+    saver.shutdown()
+    if pending_save is None:
+        print(f"No compression result after {attempts_run} attempts; nothing was saved.")
+        return None
+    pending_save.result()  # Re-raises an error from the write
+
+    print(f"Best of {attempts_run} compression saved as: {final_compressed_filename} (Strategy {best_of_30_strategy})")
     return final_compressed_filename
 
+def parse_args():
+    """Parses the command line for batch runs; returns None when no arguments were given, to keep the prompts."""
+    if len(sys.argv) == 1:
+        return None
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["compress", "extract"], required=True)
+    parser.add_argument("--input", required=True, help="file to compress, or the .compressed.bin file to extract")
+    parser.add_argument("--max-attempts", type=int, default=30, help="search attempts of 7200 trials each")
+    parser.add_argument("--jobs", type=int, default=SEARCH_WORKERS, help="search workers to run in parallel")
+    return parser.parse_args()
+
 def main():
+    global SEARCH_WORKERS
     print("Created by Jurijus Pacalovas.")
 
+    args = parse_args()
+    if args is not None:
+        SEARCH_WORKERS = args.jobs
+        if args.mode == "compress":
+            best_compressed_filename = run_compression(args.input, args.max_attempts)
+            if best_compressed_filename:
+                decompress_and_restore_paq(best_compressed_filename)
+        else:
+            decompress_and_restore_paq(args.input)
+        return
+
     while True:
         try:
             mode = int(input("Enter mode (1 for compress, 2 for extract): "))
@@ -134,7 +280,8 @@ def main():
         best_compressed_filename = run_compression(input_filename)
 
         # Decompress the best compression result
-        decompress_and_restore_paq(best_compressed_filename)
+        if best_compressed_filename:
+            decompress_and_restore_paq(best_compressed_filename)
 
     elif mode == 2:
         compressed_filename = input("Enter the full name of the compressed file to extract: ")
@@ -1,30 +1,41 @@
+import heapq
 import os
 import random
 import struct
 import paq
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+SEARCH_WORKERS = os.cpu_count() or 1  # Processes running compression attempts in parallel (paq holds the GIL)
+FINALISTS = 10
+
+_search_data = None  # Input bytes held by each worker process
+_metadata_structs = {}
+
+# Flipping all four 2-bit pairs of a byte flips every bit: b ^ 0xFF == 255 - b
+_FLIP_TABLE = bytes(range(255, -1, -1))
 
 def reverse_chunks_at_positions(input_data, chunk_size, positions):
-    chunked_data = [input_data[i:i + chunk_size] for i in range(0, len(input_data), chunk_size)]
+    # Copy once into a buffer and reverse the selected chunks in place; the last chunk may be short
+    buf = bytearray(input_data)
+    num_chunks = -(-len(buf) // chunk_size)
     for pos in positions:
-        if 0 <= pos < len(chunked_data):
-            chunked_data[pos] = chunked_data[pos][::-1]
-    return b"".join(chunked_data)
+        if 0 <= pos < num_chunks:
+            lo = pos * chunk_size
+            buf[lo:lo + chunk_size] = buf[lo:lo + chunk_size][::-1]
+    return buf
 
 def flip_2bit_pairs(data):
-    modified_data = bytearray(data)
-    for i in range(0, len(modified_data) * 8, 2):
-        byte_index = i // 8
-        bit_position = i % 8
-        if byte_index < len(modified_data):
-            byte = modified_data[byte_index]
-            bit_pair = (byte >> (6 - bit_position)) & 0b11
-            flipped_pair = bit_pair ^ 0b11
-            modified_data[byte_index] = (byte & ~(0b11 << (6 - bit_position))) | (flipped_pair << (6 - bit_position))
-    return bytes(modified_data)
+    return bytes(data).translate(_FLIP_TABLE)
+
+def metadata_struct(num_positions):
+    fmt = _metadata_structs.get(num_positions)
+    if fmt is None:
+        fmt = _metadata_structs[num_positions] = struct.Struct(f">IIB{num_positions}I")
+    return fmt
 
 def compress_with_paq(data, chunk_size, positions, original_size):
-    metadata = struct.pack(">I", original_size) + struct.pack(">I", chunk_size) + \
-               struct.pack(">B", len(positions)) + struct.pack(f">{len(positions)}I", *positions)
+    metadata = metadata_struct(len(positions)).pack(original_size, chunk_size, len(positions), *positions)
     return paq.compress(metadata + data)
 
 def decompress_with_paq(compressed_data):
@@ -40,19 +51,23 @@ def decompress_with_paq(compressed_data):
 
     return original_data[:original_size]
 
-def find_best_iteration(input_filename, max_iterations):
-    with open(input_filename, 'rb') as infile:
-        file_data = infile.read()
-        file_size = len(file_data)
-
-    best_compression_ratio = float('inf')
-    best_compressed_data = None
+def find_best_iteration(file_data, max_iterations):
+    file_size = len(file_data)
 
+    candidates = []
     for _ in range(max_iterations):
         chunk_size = random.randint(1, min(256, file_size))
         num_positions = random.randint(0, min(file_size // chunk_size, 64))
         positions = sorted(random.sample(range(file_size // chunk_size), num_positions)) if num_positions > 0 else []
 
+        modified_data = reverse_chunks_at_positions(file_data, chunk_size, positions)
+        modified_data = flip_2bit_pairs(modified_data)
+        candidates.append((len(zlib.compress(modified_data, 1)), chunk_size, positions))
+
+    best_compression_ratio = float('inf')
+    best_compressed_data = None
+
+    for _, chunk_size, positions in heapq.nsmallest(FINALISTS, candidates, key=lambda candidate: candidate[0]):
         modified_data = reverse_chunks_at_positions(file_data, chunk_size, positions)
         modified_data = flip_2bit_pairs(modified_data)
 
@@ -65,17 +80,28 @@ def find_best_iteration(input_filename, max_iterations):
 
     return best_compressed_data, best_compression_ratio
 
+def init_search_worker(data):
+    global _search_data
+    _search_data = data
+    random.seed()  # Forked workers would otherwise all draw the parent's sequence
+
+def run_attempt(max_iterations):
+    return find_best_iteration(_search_data, max_iterations)
+
 def run_compression(input_filename):
     best_compressed_data = None
     best_ratio = float('inf')
 
-    for i in range(1, 9):  
-        print(f"Running compression attempt {i} with 300 iterations...")
-        compressed_data, compression_ratio = find_best_iteration(input_filename, 300)
+    with open(input_filename, 'rb') as infile:
+        file_data = infile.read()
 
-        if compressed_data and compression_ratio < best_ratio:
-            best_ratio = compression_ratio
-            best_compressed_data = compressed_data
+    print("Running 8 compression attempts with 300 iterations...")
+    # Independent attempts run on worker processes that each hold a copy of the input
+    with ProcessPoolExecutor(max_workers=SEARCH_WORKERS, initializer=init_search_worker, initargs=(file_data,)) as executor:
+        for compressed_data, compression_ratio in executor.map(run_attempt, [300] * 8):
+            if compressed_data and compression_ratio < best_ratio:
+                best_ratio = compression_ratio
+                best_compressed_data = compressed_data
 
     final_compressed_filename = f"{input_filename}.compressed.bin"
     with open(final_compressed_filename, 'wb') as outfile:
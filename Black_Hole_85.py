@@ -1,30 +1,39 @@
+import heapq
 import os
 import random
 import struct
 import time
 import paq
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+SEARCH_WORKERS = os.cpu_count() or 1  # Processes running compression attempts in parallel (paq holds the GIL)
+FINALISTS = 10  # Candidates with the smallest zlib sizes that are compressed with paq
+
+_search_data = None  # Input bytes held by each worker process
+_metadata_structs = {}  # Number of positions -> struct.Struct packing the metadata
 
 def reverse_chunks_at_positions(input_data, chunk_size, positions):
     """Reverses specified chunks of byte data."""
-    chunked_data = [input_data[i:i + chunk_size] for i in range(0, len(input_data), chunk_size)]
+    # Copy once into a buffer and reverse the selected chunks in place; the last chunk may be short
+    buf = bytearray(input_data)
+    num_chunks = -(-len(buf) // chunk_size)
     for pos in positions:
-        if 0 <= pos < len(chunked_data):
-            chunked_data[pos] = chunked_data[pos][::-1]
-    return b"".join(chunked_data)
-
-def add_random_bytes(data, num_bytes=1):
-    """Adds random 1-byte sequences at random positions."""
-    num_insertions = max(1, len(data) // 100)
-    for _ in range(num_insertions):
-        pos = random.randint(0, max(0, len(data) - num_bytes))
-        data = data[:pos] + os.urandom(num_bytes) + data[pos:]
-    return data
+        if 0 <= pos < num_chunks:
+            lo = pos * chunk_size
+            buf[lo:lo + chunk_size] = buf[lo:lo + chunk_size][::-1]
+    return buf
+
+def metadata_struct(num_positions):
+    """Returns the cached struct.Struct that packs the metadata, strategy byte included, for num_positions positions."""
+    fmt = _metadata_structs.get(num_positions)
+    if fmt is None:
+        fmt = _metadata_structs[num_positions] = struct.Struct(f">IIB{num_positions}IB")
+    return fmt
 
 def compress_with_paq(data, chunk_size, positions, original_size, strategy):
     """Compresses data using PAQ and embeds metadata, including the strategy used."""
-    metadata = struct.pack(">I", original_size) + struct.pack(">I", chunk_size) + \
-               struct.pack(">B", len(positions)) + struct.pack(f">{len(positions)}I", *positions) + \
-               struct.pack(">B", strategy)  # Add strategy info
+    metadata = metadata_struct(len(positions)).pack(original_size, chunk_size, len(positions), *positions, strategy)
     return paq.compress(metadata + data)
 
 def decompress_and_restore_paq(compressed_filename):
@@ -55,24 +64,25 @@ def decompress_and_restore_paq(compressed_filename):
     except Exception as e:
         print(f"Error during decompression: {e}")
 
-def find_best_iteration(input_filename, max_iterations):
+def find_best_iteration(file_data, max_iterations):
     """Finds the best compression within a single attempt (out of 7200 iterations)."""
-    if not os.path.exists(input_filename):
-        print("Error: File not found! Check the path and try again.")
-        exit()  # Stops execution
-    
-    with open(input_filename, 'rb') as infile:
-        file_data = infile.read()
-        file_size = len(file_data)
-
-    best_compression_ratio = float('inf')
-    best_compressed_data = None
+    file_size = len(file_data)
 
+    # zlib at level 1 costs a tiny fraction of paq, so every candidate is ranked by its zlib size
+    # and only the FINALISTS smallest are compressed with paq
+    candidates = []
     for _ in range(max_iterations):
         chunk_size = random.randint(1, min(256, file_size))
         num_positions = random.randint(0, min(file_size // chunk_size, 64))
         positions = sorted(random.sample(range(file_size // chunk_size), num_positions)) if num_positions > 0 else []
 
+        reversed_data = reverse_chunks_at_positions(file_data, chunk_size, positions)
+        candidates.append((len(zlib.compress(reversed_data, 1)), chunk_size, positions))
+
+    best_compression_ratio = float('inf')
+    best_compressed_data = None
+
+    for _, chunk_size, positions in heapq.nsmallest(FINALISTS, candidates, key=lambda candidate: candidate[0]):
         reversed_data = reverse_chunks_at_positions(file_data, chunk_size, positions)
         compressed_data = compress_with_paq(reversed_data, chunk_size, positions, file_size, 0)
         compression_ratio = len(compressed_data) / file_size
@@ -83,27 +93,45 @@ def find_best_iteration(input_filename, max_iterations):
 
     return best_compressed_data, best_compression_ratio
 
+def init_search_worker(data):
+    """Stores the input once per worker process and gives it its own random stream."""
+    global _search_data
+    _search_data = data
+    random.seed()  # Forked workers would otherwise all draw the parent's sequence
+
+def run_attempt(max_iterations):
+    """Runs one independent compression attempt on the worker's copy of the input."""
+    return find_best_iteration(_search_data, max_iterations)
+
 def run_compression(input_filename):
     """Runs 30 attempts, each with 7200 iterations, and keeps only the best compression result."""
     best_of_30_compressed_data = None
     best_of_30_ratio = float('inf')
 
-    for i in range(30):
-        print(f"Running compression attempt {i+1}/9 with 7200 iterations...")
-        compressed_data, compression_ratio = find_best_iteration(input_filename, 7200)
-
-        if compressed_data and compression_ratio < best_of_30_ratio:
-            best_of_30_ratio = compression_ratio
-            best_of_30_compressed_data = compressed_data
+    if not os.path.exists(input_filename):
+        print("Error: File not found! Check the path and try again.")
+        exit()  # Stops execution
 
-        # Print the size of the compressed file after the attempt
-        compressed_size = len(compressed_data)
-        print(f"Attempt {i+1} compressed size: {compressed_size} bytes")
+    # Read once; every attempt searches the same bytes
+    with open(input_filename, 'rb') as infile:
+        file_data = infile.read()
 
-        # Remove intermediate files
-        temp_filename = f"{input_filename}_attempt_{i}.compressed.bin"
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
+    print("Running 30 compression attempts with 7200 iterations...")
+    # Independent attempts run on worker processes that each hold a copy of the input
+    with ProcessPoolExecutor(max_workers=SEARCH_WORKERS, initializer=init_search_worker, initargs=(file_data,)) as executor:
+        for i, (compressed_data, compression_ratio) in enumerate(executor.map(run_attempt, [7200] * 30)):
+            if compressed_data and compression_ratio < best_of_30_ratio:
+                best_of_30_ratio = compression_ratio
+                best_of_30_compressed_data = compressed_data
+
+            # Print the size of the compressed file after the attempt
+            compressed_size = len(compressed_data)
+            print(f"Attempt {i+1} compressed size: {compressed_size} bytes")
+
+            # Remove intermediate files
+            temp_filename = f"{input_filename}_attempt_{i}.compressed.bin"
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
 
     # Save the best compression result
     final_compressed_filename = f"{input_filename}.compressed.bin"
@@ -1,32 +1,42 @@
+import heapq
 import os
 import random
 import struct
 import paq
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 
 # Constants for clarity
 METADATA_HEADER_SIZE = 9  # Size of the metadata header in bytes
 MAX_POSITIONS = 64       # Maximum number of chunk positions to reverse
+SEARCH_WORKERS = os.cpu_count() or 1  # Processes running compression attempts in parallel (paq holds the GIL)
+FINALISTS = 10  # Candidates with the smallest zlib sizes that are compressed with paq
+
+_search_data = None  # Input bytes held by each worker process
+_metadata_structs = {}  # Number of positions -> struct.Struct packing the metadata
 
 def reverse_chunks(data, chunk_size, positions):
     """Reverses specified chunks of byte data."""
-    chunked_data = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    # Copy once into a buffer and reverse the selected chunks in place; the last chunk may be short
+    buf = bytearray(data)
+    num_chunks = -(-len(buf) // chunk_size)
     for pos in positions:
-        if 0 <= pos < len(chunked_data):
-            chunked_data[pos] = chunked_data[pos][::-1]
-    return b"".join(chunked_data)
+        if 0 <= pos < num_chunks:
+            lo = pos * chunk_size
+            buf[lo:lo + chunk_size] = buf[lo:lo + chunk_size][::-1]
+    return buf
 
-def add_random_bytes(data, num_insertions, num_bytes=1):
-    """Adds random bytes at random positions."""
-    for _ in range(num_insertions):
-        pos = random.randint(0, max(0, len(data) - num_bytes))
-        data = data[:pos] + os.urandom(num_bytes) + data[pos:]
-    return data
 
+def metadata_struct(num_positions):
+    """Returns the cached struct.Struct that packs the metadata for num_positions positions."""
+    fmt = _metadata_structs.get(num_positions)
+    if fmt is None:
+        fmt = _metadata_structs[num_positions] = struct.Struct(f">IIB{num_positions}I")
+    return fmt
 
 def compress_data(data, chunk_size, positions, original_size):
     """Compresses data using PAQ and embeds metadata."""
-    metadata = struct.pack(">I", original_size) + struct.pack(">I", chunk_size) + \
-               struct.pack(">B", len(positions)) + struct.pack(f">{len(positions)}I", *positions)
+    metadata = metadata_struct(len(positions)).pack(original_size, chunk_size, len(positions), *positions)
     return paq.compress(metadata + data)
 
 def decompress_data(compressed_data):
@@ -41,33 +51,48 @@ def decompress_data(compressed_data):
         raise Exception(f"Error during decompression: {e}") from None
 
 
-def find_best_iteration(input_data, max_iterations):
-    """Finds the best compression within a specified number of iterations using a heuristic."""
-    best_compression_ratio = float('inf')
-    best_compressed_data = None
-    best_chunk_size = 0
+def screen_candidates(input_data, max_iterations):
+    """Ranks max_iterations random layouts by their zlib size and returns the FINALISTS smallest."""
+    # Medium chunk size, or half the data length for small inputs
+    chunk_size = min(128, len(input_data) // 2)
 
+    # zlib at level 1 costs a tiny fraction of paq, so candidates are ranked by it and only the
+    # smallest ones are later compressed with paq
+    candidates = []
     for _ in range(max_iterations):
-        # Adaptive chunk size: Start with a medium size, adjust based on previous results
-        chunk_size = best_chunk_size or min(128, len(input_data) // 2)  # Default to half the data length
-
         num_positions = random.randint(0, min(len(input_data) // chunk_size, MAX_POSITIONS))
         positions = sorted(random.sample(range(len(input_data) // chunk_size), num_positions)) if num_positions > 0 else []
 
         reversed_data = reverse_chunks(input_data, chunk_size, positions)
-        compressed_data = compress_data(reversed_data, chunk_size, positions, len(input_data))
-        compression_ratio = len(compressed_data) / len(input_data)
+        candidates.append((len(zlib.compress(reversed_data, 1)), chunk_size, positions))
+
+    return heapq.nsmallest(FINALISTS, candidates, key=lambda candidate: candidate[0])
+
+def compress_candidate(input_data, candidate):
+    """Compresses one screened layout with paq and returns the result with its compression ratio."""
+    _, chunk_size, positions = candidate
+    reversed_data = reverse_chunks(input_data, chunk_size, positions)
+    compressed_data = compress_data(reversed_data, chunk_size, positions, len(input_data))
+    return compressed_data, len(compressed_data) / len(input_data)
 
-        if compression_ratio < best_compression_ratio:
-            best_compression_ratio = compression_ratio
-            best_compressed_data = compressed_data
-            best_chunk_size = chunk_size  # Update best chunk size
+def split_iterations(max_iterations, parts):
+    """Splits max_iterations into up to parts near-equal, non-empty shares."""
+    shares = (max_iterations // parts + (i < max_iterations % parts) for i in range(parts))
+    return [n for n in shares if n]
 
-        # Adjust chunk size based on compression ratio (example heuristic)
-        if compression_ratio > 0.8: #If compression is poor, try a different chunk size
-            chunk_size = max(1, chunk_size // 2) #Reduce chunk size
+def init_search_worker(data):
+    """Stores the input once per worker process and gives it its own random stream."""
+    global _search_data
+    _search_data = data
+    random.seed()  # Forked workers would otherwise all draw the parent's sequence
 
-    return best_compressed_data, best_compression_ratio
+def run_screening(max_iterations):
+    """Screens max_iterations random layouts on the worker's copy of the input."""
+    return screen_candidates(_search_data, max_iterations)
+
+def run_finalist(candidate):
+    """Compresses one finalist with paq on the worker's copy of the input."""
+    return compress_candidate(_search_data, candidate)
 
 
 def run_compression(input_filename, num_attempts, iterations_per_attempt):
@@ -81,16 +106,25 @@ def run_compression(input_filename, num_attempts, iterations_per_attempt):
     best_of_all_compressed_data = None
     best_of_all_ratio = float('inf')
 
-    for i in range(num_attempts):
-        print(f"Running compression attempt {i+1}/{num_attempts} with {iterations_per_attempt} iterations...")
-        compressed_data, compression_ratio = find_best_iteration(file_data, iterations_per_attempt)
-        compressed_size = len(compressed_data)
-
-        print(f"Attempt {i+1} compressed size: {compressed_size} bytes, ratio: {compression_ratio:.4f}")
-
-        if compressed_data and compression_ratio < best_of_all_ratio:
-            best_of_all_ratio = compression_ratio
-            best_of_all_compressed_data = compressed_data
+    print(f"Running {num_attempts} compression attempts with {iterations_per_attempt} iterations...")
+    # Independent attempts run on worker processes that each hold a copy of the input; with fewer
+    # attempts than workers, each attempt's iterations are split into shares screened side by side
+    shares = split_iterations(iterations_per_attempt, max(1, SEARCH_WORKERS // num_attempts))
+    with ProcessPoolExecutor(max_workers=SEARCH_WORKERS, initializer=init_search_worker, initargs=(file_data,)) as executor:
+        # Each attempt's FINALISTS are picked across all of its shares, so paq runs FINALISTS times per attempt
+        screened = executor.map(run_screening, shares * num_attempts)
+        finalists = [heapq.nsmallest(FINALISTS, [candidate for _ in shares for candidate in next(screened)], key=lambda candidate: candidate[0])
+                     for _ in range(num_attempts)]
+        results = executor.map(run_finalist, [candidate for attempt in finalists for candidate in attempt])
+        for i, attempt in enumerate(finalists):
+            compressed_data, compression_ratio = min((next(results) for _ in attempt), key=lambda result: result[1])
+            compressed_size = len(compressed_data)
+
+            print(f"Attempt {i+1} compressed size: {compressed_size} bytes, ratio: {compression_ratio:.4f}")
+
+            if compressed_data and compression_ratio < best_of_all_ratio:
+                best_of_all_ratio = compression_ratio
+                best_of_all_compressed_data = compressed_data
 
     return best_of_all_compressed_data, best_of_all_ratio
 
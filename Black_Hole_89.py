@@ -1,31 +1,46 @@
+import heapq
 import os
 import random
 import struct
 import paq
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 
 # Constants
 MAX_POSITIONS = 64  # Maximum number of chunk positions to reverse
+SEARCH_WORKERS = os.cpu_count() or 1  # Processes sharing the iterations (paq holds the GIL)
+FINALISTS = 10  # Candidates with the smallest zlib sizes that are compressed with paq
+
+_search_data = None  # Input bytes held by each search worker process
+_metadata_structs = {}  # Number of positions -> struct.Struct packing the metadata
 
 def reverse_chunks(data, chunk_size, positions):
     """Reverses specified chunks of byte data."""
-    chunked_data = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    # Copy once into a buffer and reverse the selected chunks in place; the last chunk may be short
+    buf = bytearray(data)
+    num_chunks = -(-len(buf) // chunk_size)
     for pos in positions:
-        if 0 <= pos < len(chunked_data):
-            chunked_data[pos] = chunked_data[pos][::-1]
-    return b"".join(chunked_data)
+        if 0 <= pos < num_chunks:
+            lo = pos * chunk_size
+            buf[lo:lo + chunk_size] = buf[lo:lo + chunk_size][::-1]
+    return buf
 
 def apply_calculus(data, calculus_value):
     """Applies bitwise transformations to each byte."""
-    transformed_data = bytearray(data)
-    for i in range(len(transformed_data)):
-        transformed_data[i] ^= (calculus_value & 0xFF)  # XOR with last 8 bits
-    return bytes(transformed_data)
+    key = calculus_value & 0xFF  # XOR with last 8 bits
+    return bytes(data).translate(bytes(b ^ key for b in range(256)))  # One table lookup per byte, in C
+
+def metadata_struct(num_positions):
+    """Returns the cached struct.Struct that packs the metadata for num_positions positions."""
+    fmt = _metadata_structs.get(num_positions)
+    if fmt is None:
+        fmt = _metadata_structs[num_positions] = struct.Struct(f">IIIB{num_positions}I")
+    return fmt
 
 def compress_data(data, chunk_size, positions, original_size, calculus_value):
     """Compresses data using PAQ and embeds metadata."""
-    # Adding 7 items for packing (original_size, chunk_size, calculus_value, num_positions, positions)
-    metadata = struct.pack(">III", original_size, chunk_size, calculus_value) + \
-               struct.pack(">B", len(positions)) + struct.pack(f">{len(positions)}I", *positions)
+    # Packed items: original_size, chunk_size, calculus_value, num_positions, positions
+    metadata = metadata_struct(len(positions)).pack(original_size, chunk_size, calculus_value, len(positions), *positions)
     return paq.compress(metadata + data)
 
 def decompress_data(compressed_data):
@@ -43,11 +58,11 @@ def decompress_data(compressed_data):
     except (struct.error, paq.error) as e:
         raise Exception(f"Error during decompression: {e}") from None
 
-def find_best_iteration(input_data, max_iterations):
-    """Finds the best compression within a specified number of iterations using a heuristic."""
-    best_compression_ratio = float('inf')
-    best_compressed_data = None
-
+def screen_candidates(input_data, max_iterations):
+    """Ranks max_iterations random transforms by their zlib size and returns the FINALISTS smallest."""
+    # zlib at level 1 costs a tiny fraction of paq, so candidates are ranked by it and only the
+    # smallest ones are later compressed with paq
+    candidates = []
     for _ in range(max_iterations):
         chunk_size = random.randint(2**7, 2**17 - 1)  # Random chunk size in the range 2⁷ to 2¹⁷
         x = random.randint(7, 17)  # Randomly choose x between 7 and 17
@@ -58,15 +73,35 @@ def find_best_iteration(input_data, max_iterations):
 
         transformed_data = apply_calculus(input_data, calculus_value)
         reversed_data = reverse_chunks(transformed_data, chunk_size, positions)
-        compressed_data = compress_data(reversed_data, chunk_size, positions, len(input_data), calculus_value)
+        candidates.append((len(zlib.compress(reversed_data, 1)), chunk_size, positions, calculus_value))
+
+    return heapq.nsmallest(FINALISTS, candidates, key=lambda candidate: candidate[0])
+
+def compress_candidate(input_data, candidate):
+    """Compresses one screened transform with paq and returns the result with its compression ratio."""
+    _, chunk_size, positions, calculus_value = candidate
+    reversed_data = reverse_chunks(apply_calculus(input_data, calculus_value), chunk_size, positions)
+    compressed_data = compress_data(reversed_data, chunk_size, positions, len(input_data), calculus_value)
+    return compressed_data, len(compressed_data) / len(input_data)
+
+def split_iterations(max_iterations, parts):
+    """Splits max_iterations into up to parts near-equal, non-empty shares."""
+    shares = (max_iterations // parts + (i < max_iterations % parts) for i in range(parts))
+    return [n for n in shares if n]
 
-        compression_ratio = len(compressed_data) / len(input_data)
+def init_search_worker(data):
+    """Stores the input once per worker process and gives it its own random stream."""
+    global _search_data
+    _search_data = data
+    random.seed()  # Forked workers would otherwise all draw the parent's sequence
 
-        if compression_ratio < best_compression_ratio:
-            best_compression_ratio = compression_ratio
-            best_compressed_data = compressed_data
+def run_screening(max_iterations):
+    """Screens one share of the random search on the worker's copy of the input."""
+    return screen_candidates(_search_data, max_iterations)
 
-    return best_compressed_data, best_compression_ratio
+def run_finalist(candidate):
+    """Compresses one finalist with paq on the worker's copy of the input."""
+    return compress_candidate(_search_data, candidate)
 
 def process_large_file(input_filename, output_filename, mode, attempts=1, iterations=100):
     """Handles large files in chunks and applies compression or decompression."""
@@ -77,7 +112,13 @@ def process_large_file(input_filename, output_filename, mode, attempts=1, iterat
         file_data = infile.read()
 
     if mode == "compress":
-        best_compressed_data, best_ratio = find_best_iteration(file_data, iterations)
+        # The iterations are independent draws, so each worker screens its own share; the FINALISTS
+        # are then picked across all shares, so paq runs FINALISTS times however many workers there are
+        with ProcessPoolExecutor(max_workers=SEARCH_WORKERS, initializer=init_search_worker, initargs=(file_data,)) as executor:
+            screened = executor.map(run_screening, split_iterations(iterations, SEARCH_WORKERS))
+            finalists = heapq.nsmallest(FINALISTS, [candidate for share in screened for candidate in share], key=lambda candidate: candidate[0])
+            results = executor.map(run_finalist, finalists)
+            best_compressed_data, best_ratio = min(results, key=lambda result: result[1])
         if best_compressed_data:
             with open(output_filename, 'wb') as outfile:
                 outfile.write(best_compressed_data)